@@ -0,0 +1,643 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import calendar
+import hashlib
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+import time
+
+# Label that every synthetic issue carries (used as the label filter)
+filter_label = 'migrate'
+# Label on a share of the issues that the migration is configured to exclude
+excluded_label = 'wontfix'
+squads = [f'squad:team-{index}' for index in range(10)]
+components = {squad: f'Team {index}' for index, squad in enumerate(squads)}
+type_labels = ['task', 'bug', 'user_story', 'Epic']
+priority_labels = ['blocker (P0)', 'Priority/P1', 'Priority/P2', 'Priority/P3']
+severity_labels = ['Severity 1 - Urgent',
+                   'Severity 2 - Major', 'Severity 3 - Minor']
+pipelines = ['New Issues', 'Backlog', 'In Progress',
+             'Awaiting Verification', 'Closed']
+releases = ['2.5', '2.6', '2.7']
+repo_id = 4242
+# Creation time of the first synthetic issue (each later issue is created an hour after the one before)
+created_start = 1640995200
+# Most results the search API returns for a query
+search_result_limit = 1000
+# Number of distinct screenshots pasted into synthetic issues, and the size of each
+attachment_files = 20
+attachment_size = 256 * 1024
+
+# Jira workflows per issue type: {status: {transition ID: (transition name, to status)}}
+bug_workflow = {
+    'NEW': {'11': ('Assign', 'ASSIGNED'), '12': ('Close', 'Closed')},
+    'ASSIGNED': {'21': ('Post', 'POST'), '22': ('Unassign', 'NEW')},
+    'POST': {'31': ('Test', 'ON_QA'), '32': ('Back to Assigned', 'ASSIGNED')},
+    'ON_QA': {'41': ('Verify', 'VERIFIED'), '42': ('Close', 'Closed')},
+    'VERIFIED': {'51': ('Close', 'Closed')},
+    'Closed': {'61': ('Reopen', 'NEW')},
+}
+default_workflow = {
+    'New': {'11': ('Start', 'In Progress'), '12': ('Close', 'Closed')},
+    'In Progress': {'21': ('Review', 'Review'), '22': ('Stop', 'New')},
+    'Review': {'31': ('Test', 'Testing'), '32': ('Close', 'Closed')},
+    'Testing': {'41': ('Close', 'Closed')},
+    'Closed': {'51': ('Reopen', 'New')},
+}
+
+
+def status_category(status):
+    """Return the Jira status category of a workflow status"""
+
+    return 'done' if status == 'Closed' else 'indeterminate'
+
+
+def attachment_url(file_id):
+    """Return the GitHub URL of a synthetic screenshot"""
+
+    return f'https://github.com/user-attachments/assets/00000000-0000-4000-8000-{file_id:012d}'
+
+
+def attachment_content(file_id):
+    """Return the content of a synthetic screenshot"""
+
+    return hashlib.sha256(str(file_id).encode('ascii')).digest() * (attachment_size // 32)
+
+
+def synthetic_issue(repo, number, comment_count, attachment_rate=0):
+    """Return a GitHub issue of a repo with labels, assignees, and comments generated from its number"""
+
+    rng = random.Random(number)
+    label_names = [filter_label, rng.choice(type_labels), rng.choice(
+        priority_labels), rng.choice(squads)]
+    if rng.random() < 0.1:
+        # Multi-squad issues aren't closed after migration
+        label_names.append(rng.choice(squads))
+    if rng.random() < 0.3:
+        label_names.append(rng.choice(severity_labels))
+    if rng.random() < 0.05:
+        label_names.append('bugzilla')
+    if rng.random() < 0.05:
+        label_names.append(excluded_label)
+    body = f'Steps to reproduce issue {number}\n\n' + 'Lorem ipsum dolor sit amet. ' * rng.randint(1, 40)
+    if rng.random() < attachment_rate:
+        body += f'\n\n![screenshot]({attachment_url(rng.randrange(attachment_files))})'
+
+    return {
+        'id': 100000 + number,
+        'node_id': f'I_{number}',
+        'number': number,
+        'title': f'Synthetic issue {number}',
+        'body': body,
+        'html_url': f'https://github.com/{repo}/issues/{number}',
+        'user': {'login': f'user{rng.randint(0, 49)}'},
+        'labels': [{'name': label_name} for label_name in dict.fromkeys(label_names)],
+        'assignees': [{'login': f'user{rng.randint(0, 49)}'} for _ in range(rng.randint(0, 2))],
+        'comments': comment_count,
+        'state': 'open',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(created_start + number * 3600)),
+        'updated_at': '2022-01-01T00:00:00Z'
+    }
+
+
+def synthetic_comment(number, index):
+    """Return a GitHub comment generated from its issue number and index"""
+
+    return {
+        'id': number * 1000 + index,
+        'node_id': f'IC_{number}_{index}',
+        'user': {'login': f'user{(number + index) % 50}'},
+        'body': f'Comment {index} on issue {number}',
+        'created_at': '2022-01-02T00:00:00Z'
+    }
+
+
+def graphql_actor(user):
+    """Return a synthetic user in the shape of a GraphQL actor (bots lose their [bot] suffix)"""
+
+    if user['login'].endswith('[bot]'):
+        return {'__typename': 'Bot', 'login': user['login'][:-len('[bot]')]}
+
+    return {'__typename': 'User', 'login': user['login']}
+
+
+def graphql_comment(comment):
+    """Return a synthetic comment in the shape of a GraphQL comment node"""
+
+    return {
+        'databaseId': comment['id'],
+        'author': graphql_actor(comment['user']),
+        'body': comment['body'],
+        'createdAt': comment['created_at']
+    }
+
+
+class FakeServices:
+    """State of the fake GitHub, Jira, and ZenHub services for a synthetic repo"""
+
+    def __init__(self, issue_count, comment_count=2, latency=0, error_rate=0, rate_limit_rate=0,
+                 retry_after=1, seed=0, attachment_rate=0):
+        self.issue_count = issue_count
+        self.comment_count = comment_count
+        self.attachment_rate = attachment_rate
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.jira_keys = itertools.count(1)
+        # Dict of Jira issue key to {'type', 'status', 'gh_issue'}
+        self.jira_issues = {}
+        # Dict of GitHub issue number to its label names for searches
+        self.labels = {}
+
+    def issue(self, repo, number):
+        """Return a synthetic GitHub issue of a repo (every repo has the same number of issues)"""
+
+        return synthetic_issue(repo, number, self.comment_count, self.attachment_rate)
+
+    def issue_labels(self, number):
+        """Return the label names of a synthetic GitHub issue (the same in every repo)"""
+
+        with self.lock:
+            if number in self.labels:
+                return self.labels[number]
+        labels = {label['name'] for label in synthetic_issue('', number, 0)['labels']}
+        with self.lock:
+            self.labels[number] = labels
+
+        return labels
+
+    def comments(self, number):
+        """Return the synthetic comments of a GitHub issue"""
+
+        return [synthetic_comment(number, index) for index in range(self.comment_count)]
+
+    def count(self, endpoint):
+        """Count a request to an endpoint"""
+
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def inject(self):
+        """Return an injected failure status for a request, if any"""
+
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+
+        return None
+
+    def create_jira_issue(self, fields):
+        """Store a created Jira issue and return its key"""
+
+        issue_key = f'ACM-{next(self.jira_keys)}'
+        issue_type = fields['issuetype']['name']
+        workflow = bug_workflow if issue_type == 'Bug' else default_workflow
+        with self.lock:
+            self.jira_issues[issue_key] = {
+                'type': issue_type,
+                'status': next(iter(workflow)),
+                'gh_issue': fields.get('customfield_12316846')
+            }
+
+        return issue_key
+
+    def workflow(self, issue_key):
+        """Return the workflow of a Jira issue"""
+
+        return bug_workflow if self.jira_issues[issue_key]['type'] == 'Bug' else default_workflow
+
+    def create_meta(self):
+        """Return Jira create metadata allowing the values of the synthetic repo"""
+
+        fields = {
+            'project': {'required': True, 'allowedValues': [{'id': '1', 'key': 'ACM', 'name': 'ACM'}]},
+            'issuetype': {'required': True},
+            'summary': {'required': True},
+            'description': {'required': False},
+            'reporter': {'required': True},
+            'components': {'required': False, 'allowedValues': [{'name': name} for name in components.values()]},
+            'priority': {'required': False, 'allowedValues': [
+                {'name': name} for name in ['Blocker', 'Critical', 'Normal', 'Minor', 'Undefined']]},
+            'customfield_12316142': {'required': False, 'allowedValues': [
+                {'value': value} for value in ['Critical', 'Moderate', 'Low']]},
+            'fixVersions': {'required': False, 'allowedValues': [{'name': name} for name in releases]},
+        }
+        issue_types = [{'name': issue_type, 'fields': fields}
+                       for issue_type in ['Task', 'Bug', 'Story', 'Epic']]
+
+        return {'projects': [{'key': 'ACM', 'issuetypes': issue_types}]}
+
+    def zenhub_issue(self, number):
+        """Return the ZenHub data of a GitHub issue"""
+
+        rng = random.Random(-number)
+
+        return {
+            'number': number,
+            'repository': {'ghId': repo_id},
+            'estimate': {'value': rng.choice([1, 2, 3, 5, 8])} if rng.random() < 0.7 else None,
+            'releases': {'nodes': [{'title': rng.choice(releases)}] if rng.random() < 0.5 else []},
+            'pipelineIssue': {'pipeline': {'name': pipelines[number % len(pipelines)]}}
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler routing to the fake GitHub (/github), Jira (/jira), and ZenHub (/zenhub) APIs"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, so don't let Nagle's algorithm hold the body back
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body=None, headers=None):
+        """Send a JSON response, answering GitHub GETs with 304 when the ETag matches"""
+
+        content = b'' if body is None else json.dumps(body).encode('utf-8')
+        headers = dict(headers or {})
+
+        if self.command == 'GET' and self.path.startswith('/github/') and status == 200:
+            headers['ETag'] = f'"{hashlib.md5(content).hexdigest()}"'
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                status = 304
+                content = b''
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def respond_file(self, content, content_type):
+        """Send a file"""
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def request_json(self):
+        """Return the JSON body of the request (or the size of a multipart upload)"""
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length == 0:
+            return {}
+
+        if self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            remaining = length
+            while remaining > 0:
+                remaining -= len(self.rfile.read(min(remaining, 64 * 1024)))
+            return {'size': length}
+
+        return json.loads(self.rfile.read(length))
+
+    def handle_request(self):
+        services = self.server.services
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self.request_json()
+
+        # Count requests per endpoint, with issue numbers and keys normalized
+        endpoint = re.sub(r'/(\d+|ACM-\d+)(?=/|$)', '/N', url.path)
+        services.count(f'{self.command} {endpoint}')
+
+        if services.latency:
+            time.sleep(services.latency)
+
+        status = services.inject()
+        if status == 429:
+            services.count('injected 429')
+            return self.respond(429, {'message': 'Rate limited'}, {'Retry-After': str(services.retry_after)})
+        if status is not None:
+            services.count('injected 500')
+            return self.respond(500, {'message': 'Injected error'})
+
+        if url.path.startswith('/github/'):
+            return self.github(url.path[len('/github'):], query, body)
+        if url.path.startswith('/jira/'):
+            return self.jira(url.path[len('/jira'):], query, body)
+        if url.path == '/zenhub/graphql':
+            return self.zenhub(body)
+
+        return self.respond(404, {'message': 'Not Found'})
+
+    def github(self, path, query, body):
+        """Handle a GitHub REST or GraphQL request"""
+
+        services = self.server.services
+        host = f'http://{self.headers["Host"]}'
+
+        if path == '/graphql':
+            return self.github_graphql(body)
+        if path == '/search/issues':
+            return self.github_search(query, host)
+        match = re.fullmatch(r'/user-attachments/assets/00000000-0000-4000-8000-(\d{12})', path)
+        if match:
+            return self.respond_file(attachment_content(int(match.group(1))), 'image/png')
+
+        match = re.fullmatch(r'/repos/([^/]+/[^/]+)(/issues(/(\d+)(/(comments|labels))?)?)?', path)
+        if not match:
+            return self.respond(404, {'message': 'Not Found'})
+
+        repo_url = f'{host}/github/repos/{match.group(1)}'
+        if match.group(2) is None:
+            return self.respond(200, {'id': repo_id, 'full_name': match.group(1)})
+
+        if match.group(3) is None:
+            # Every synthetic issue has the filter label, so only the labels list needs checking
+            labels = set(query.get('labels', [''])[0].split(',')) - {''}
+            if not labels <= {filter_label}:
+                return self.respond(200, [])
+
+            page = int(query.get('page', ['1'])[0])
+            per_page = int(query.get('per_page', ['30'])[0])
+            first = (page - 1) * per_page + 1
+            last = min(first + per_page, services.issue_count + 1)
+            issues = []
+            for number in range(first, last):
+                issue = services.issue(match.group(1), number)
+                issue['url'] = f'{repo_url}/issues/{number}'
+                issue['comments_url'] = f'{repo_url}/issues/{number}/comments'
+                issues.append(issue)
+
+            labels_param = query.get('labels', [''])[0]
+            page_url = f'{repo_url}/issues?per_page={per_page}&labels={labels_param}&page='
+            last_page = max(1, (services.issue_count + per_page - 1) // per_page)
+            links = []
+            if page < last_page:
+                links.append(f'<{page_url}{page + 1}>; rel="next"')
+            links.append(f'<{page_url}{last_page}>; rel="last"')
+            headers = {'Link': ', '.join(links)}
+            return self.respond(200, issues, headers)
+
+        number = int(match.group(4))
+        if number < 1 or number > services.issue_count:
+            return self.respond(404, {'message': 'Not Found'})
+
+        if match.group(6) == 'comments':
+            if self.command == 'POST':
+                return self.respond(201, {'id': 1, 'body': body.get('body')})
+            return self.respond(200, services.comments(number))
+        if match.group(6) == 'labels':
+            return self.respond(200, [{'name': label_name} for label_name in body.get('labels', [])])
+
+        issue = services.issue(match.group(1), number)
+        if self.command == 'PATCH':
+            issue.update(body)
+
+        return self.respond(200, issue)
+
+    def github_search(self, query, host):
+        """Handle a GitHub search API query for issues of a repo by label and creation time"""
+
+        services = self.server.services
+        terms = dict(re.findall(r'(-?\w+):("[^"]*"|\S+)', query['q'][0]))
+        labels = {label.strip('"') for term, label in re.findall(r'(-?label):("[^"]*"|\S+)', query['q'][0])
+                  if term == 'label'}
+        exclusions = {label.strip('"') for term, label in re.findall(r'(-?label):("[^"]*"|\S+)', query['q'][0])
+                      if term == '-label'}
+        repo = terms['repo']
+
+        # Issue numbers are in creation order, so the creation window is a range of numbers
+        first = 1
+        if 'created' in terms:
+            start = calendar.timegm(time.strptime(terms['created'].lstrip('>='), '%Y-%m-%dT%H:%M:%SZ'))
+            first = max(first, (start - created_start + 3599) // 3600)
+
+        if not labels <= {filter_label}:
+            numbers = []
+        else:
+            numbers = [number for number in range(first, services.issue_count + 1)
+                       if not exclusions & services.issue_labels(number)]
+
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['30'])[0])
+        if (page - 1) * per_page >= search_result_limit:
+            return self.respond(422, {'message': 'Only the first 1000 search results are available'})
+
+        repo_url = f'{host}/github/repos/{repo}'
+        items = []
+        for number in numbers[(page - 1) * per_page:page * per_page]:
+            issue = services.issue(repo, number)
+            issue['url'] = f'{repo_url}/issues/{number}'
+            issue['comments_url'] = f'{repo_url}/issues/{number}/comments'
+            items.append(issue)
+
+        return self.respond(200, {'total_count': len(numbers), 'incomplete_results': False, 'items': items})
+
+    def github_graphql(self, body):
+        """Handle the GitHub GraphQL issue and comment queries"""
+
+        services = self.server.services
+        variables = body.get('variables') or {}
+
+        if body['query'].startswith('mutation'):
+            # Batched write-backs, where each aliased mutation may fail on its own at the error rate
+            data = {}
+            errors = []
+            for alias, mutation in re.findall(r'(\w+): (addComment|addLabelsToLabelable|closeIssue)\(', body['query']):
+                services.count(f'GraphQL {mutation}')
+                if services.inject() is not None:
+                    services.count('injected mutation error')
+                    data[alias] = None
+                    errors.append({'path': [alias], 'message': 'Injected error'})
+                else:
+                    data[alias] = {'clientMutationId': None}
+            response = {'data': data}
+            if len(errors) > 0:
+                response['errors'] = errors
+            return self.respond(200, response)
+
+        if 'label(' in body['query']:
+            return self.respond(200, {'data': {'repository': {'label': {'id': f'LA_{variables["label"]}'}}}})
+
+        if 'repository(' in body['query']:
+            start = int(variables.get('after') or 0)
+            end = min(start + variables['pagination'], services.issue_count)
+            nodes = []
+            repo = f'{variables["owner"]}/{variables["name"]}'
+            for number in range(start + 1, end + 1):
+                issue = services.issue(repo, number)
+                comments = services.comments(number)
+                nodes.append({
+                    'id': issue['node_id'],
+                    'databaseId': issue['id'],
+                    'number': number,
+                    'title': issue['title'],
+                    'body': issue['body'],
+                    'url': issue['html_url'],
+                    'author': graphql_actor(issue['user']),
+                    'labels': {'nodes': issue['labels']},
+                    'assignees': {'nodes': issue['assignees']},
+                    'comments': {
+                        'pageInfo': {'hasNextPage': len(comments) > 100, 'endCursor': '100'},
+                        'nodes': [graphql_comment(comment) for comment in comments[:100]]
+                    }
+                })
+            return self.respond(200, {'data': {'repository': {
+                'databaseId': repo_id,
+                'issues': {
+                    'totalCount': services.issue_count,
+                    'pageInfo': {'hasNextPage': end < services.issue_count, 'endCursor': str(end)},
+                    'nodes': nodes
+                }
+            }}})
+
+        if 'node(' in body['query']:
+            number = int(variables['id'].split('_')[1])
+            start = int(variables.get('after') or 0)
+            comments = services.comments(number)[start:start + 100]
+            return self.respond(200, {'data': {'node': {'comments': {
+                'pageInfo': {'hasNextPage': start + 100 < services.comment_count, 'endCursor': str(start + 100)},
+                'nodes': [graphql_comment(comment) for comment in comments]
+            }}}})
+
+        return self.respond(200, {'errors': [{'message': 'Unsupported query'}]})
+
+    def jira(self, path, query, body):
+        """Handle a Jira REST request"""
+
+        services = self.server.services
+        host = f'http://{self.headers["Host"]}'
+        api_path = path[len('/rest/api/latest'):]
+
+        if api_path == '/user/search':
+            return self.respond(200, [{'name': f'jira-{query["username"][0]}'}])
+        if api_path == '/issue/createmeta':
+            return self.respond(200, services.create_meta())
+        if api_path == '/search':
+            return self.jira_search(body)
+        if api_path == '/issue' and self.command == 'POST':
+            issue_key = services.create_jira_issue(body['fields'])
+            return self.respond(201, {'key': issue_key, 'self': f'{host}/jira/rest/api/latest/issue/{issue_key}'})
+        if api_path == '/issue/bulk':
+            issues = []
+            for update in body['issueUpdates']:
+                issue_key = services.create_jira_issue(update['fields'])
+                issues.append(
+                    {'key': issue_key, 'self': f'{host}/jira/rest/api/latest/issue/{issue_key}'})
+            return self.respond(201, {'issues': issues, 'errors': []})
+
+        match = re.fullmatch(r'/issue/([^/]+)(/(comment|transitions|attachments))?', api_path)
+        if not match or not match.group(1) in services.jira_issues:
+            return self.respond(404, {'errorMessages': ['Issue Does Not Exist']})
+
+        issue_key = match.group(1)
+        jira_issue = services.jira_issues[issue_key]
+        if match.group(3) == 'comment':
+            return self.respond(201, {'id': '1', 'body': body.get('body')})
+        if match.group(3) == 'attachments':
+            attachment_id = next(services.jira_keys)
+            return self.respond(200, [{
+                'id': str(attachment_id),
+                'filename': 'file',
+                'size': body.get('size'),
+                'content': f'{host}/jira/secure/attachment/{attachment_id}/file'
+            }])
+        if match.group(3) == 'transitions':
+            workflow = services.workflow(issue_key)
+            transitions = workflow[jira_issue['status']]
+            if self.command == 'GET':
+                return self.respond(200, {'transitions': [
+                    {'id': transition_id, 'name': name,
+                     'to': {'name': to_status, 'statusCategory': {'key': status_category(to_status)}}}
+                    for transition_id, (name, to_status) in transitions.items()]})
+            transition_id = body['transition']['id']
+            if not transition_id in transitions:
+                return self.respond(400, {'errorMessages': ['Transition is not valid for the current status']})
+            jira_issue['status'] = transitions[transition_id][1]
+            return self.respond(204)
+        if self.command == 'PUT':
+            return self.respond(204)
+
+        return self.respond(200, {'key': issue_key, 'fields': {
+            'issuetype': {'name': jira_issue['type']},
+            'status': {'name': jira_issue['status']}
+        }})
+
+    def jira_search(self, body):
+        """Handle a JQL search for issues linked to GitHub issues"""
+
+        services = self.server.services
+        jql = body.get('jql', '')
+
+        with services.lock:
+            linked = [(issue_key, jira_issue['gh_issue']) for issue_key, jira_issue in services.jira_issues.items()
+                      if jira_issue['gh_issue']]
+        match = re.search(r'= "([^"]+)"', jql)
+        if match:
+            linked = [(issue_key, gh_issue)
+                      for issue_key, gh_issue in linked if gh_issue == match.group(1)]
+
+        start_at = body.get('startAt', 0)
+        max_results = body.get('maxResults', 50)
+        issues = [{'key': issue_key, 'fields': {'customfield_12316846': gh_issue}}
+                  for issue_key, gh_issue in linked[start_at:start_at + max_results]]
+
+        return self.respond(200, {'startAt': start_at, 'maxResults': max_results, 'total': len(linked),
+                                  'issues': issues})
+
+    def zenhub(self, body):
+        """Handle the ZenHub GraphQL issue, pipeline, and pipeline issue queries"""
+
+        services = self.server.services
+        variables = body.get('variables') or {}
+
+        if 'issueByInfo' in body['query']:
+            return self.respond(200, {'data': {'issueByInfo': services.zenhub_issue(variables['issueNumber'])}})
+        if 'pipelinesConnection' in body['query']:
+            return self.respond(200, {'data': {'workspace': {'pipelinesConnection': {
+                'nodes': [{'id': str(index), 'name': name} for index, name in enumerate(pipelines)]
+            }}}})
+        if 'searchIssuesByPipeline' in body['query']:
+            pipeline_index = int(variables['pipelineId'])
+            numbers = range(pipeline_index or len(pipelines), services.issue_count + 1, len(pipelines))
+            start = int(variables.get('after') or 0)
+            page = numbers[start:start + 100]
+            return self.respond(200, {'data': {'searchIssuesByPipeline': {
+                'pageInfo': {'hasNextPage': start + 100 < len(numbers), 'endCursor': str(start + 100)},
+                'nodes': [services.zenhub_issue(number) for number in page]
+            }}})
+
+        return self.respond(200, {'errors': [{'message': 'Unsupported query'}]})
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def do_PUT(self):
+        self.handle_request()
+
+    def do_PATCH(self):
+        self.handle_request()
+
+
+def start(services, port=0):
+    """Start serving the fake services on a local port in a background thread"""
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.services = services
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
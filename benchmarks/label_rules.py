@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# Run from anywhere with the repo root on the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.labelutils as labelutils  # noqa: E402
+
+component_map = {f'squad:team-{index}': f'Team {index}' for index in range(40)}
+component_map.update(
+    {f'squad:team-{index}-ui': f'Team {index} UI' for index in range(10)})
+component_map.update({f'area/{index}': f'Area {index}' for index in range(20)})
+label_exclusions = 'migrated,squad-migrated,wontfix,duplicate'
+no_close_labels = labelutils.default_no_close_labels
+filler_labels = [f'filler-{index}' for index in range(200)]
+
+
+def synthetic_issues(count, seed=0):
+    """Return synthetic GitHub issues with a realistic mix of labels"""
+
+    rng = random.Random(seed)
+    label_pool = (list(component_map) + list(labelutils.default_type_map) +
+                  list(labelutils.default_priority_map) + list(labelutils.default_severity_map) +
+                  no_close_labels.split(',') + label_exclusions.split(',') + filler_labels)
+
+    issues = []
+    for number in range(count):
+        label_names = rng.sample(label_pool, rng.randint(1, 12))
+        issues.append({
+            'number': number,
+            'labels': [{'name': label_name} for label_name in label_names]
+        })
+
+    return issues
+
+
+def has_label_linear(issue, label_query):
+    """Label check as it was done before label rules were compiled"""
+
+    label_list = label_query.split(',')
+    for label_obj in issue['labels']:
+        for label_name in label_list:
+            if str(label_obj['name']) == label_name:
+                return True
+
+    return False
+
+
+def map_linear(gh_labels, issue):
+    """Label mapping as it was done before label rules were compiled (a separate scan per field)"""
+
+    components = []
+    component_count = 0
+    is_ui = False
+    for label in gh_labels:
+        label_name = str(label['name'])
+        if label_name.startswith('squad:'):
+            component_count += 1
+            if label_name in component_map:
+                components.append({'name': component_map[label_name]})
+                if label_name.endswith('-ui'):
+                    is_ui = True
+        elif label_name in component_map:
+            component_count += 1
+            components.append({'name': component_map[label_name]})
+
+    type_map = dict(labelutils.default_type_map)
+    issue_type = 'Task'
+    for label in gh_labels:
+        if str(label['name']) in type_map:
+            issue_type = type_map[str(label['name'])]
+            break
+
+    priority_map = dict(labelutils.default_priority_map)
+    priority = 'Undefined'
+    for label in gh_labels:
+        if str(label['name']) in priority_map:
+            priority = priority_map[str(label['name'])]
+            break
+
+    severity_map = dict(labelutils.default_severity_map)
+    severity = None
+    for label in gh_labels:
+        if str(label['name']) in severity_map:
+            severity = severity_map[str(label['name'])]
+            break
+
+    return {
+        'type': issue_type,
+        'priority': priority,
+        'severity': severity,
+        'components': components,
+        'component_count': component_count,
+        'is_ui': is_ui,
+        'no_close': has_label_linear(issue, no_close_labels),
+        'excluded': has_label_linear(issue, label_exclusions)
+    }
+
+
+def run(name, function, issues):
+    """Time a mapping function over all issues and print the per-issue cost"""
+
+    start = time.perf_counter()
+    results = [function(issue) for issue in issues]
+    elapsed = time.perf_counter() - start
+    print(f'* {name}: {elapsed:.3f}s total, {elapsed / len(issues) * 1e6:.2f}us per issue')
+
+    return results
+
+
+description = 'Benchmark per-issue label mapping with and without compiled label rules'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument(
+    '-n', '--issues', type=int, default=100000,
+    help='Number of synthetic issues to map')
+args = parser.parse_args()
+
+issues = synthetic_issues(args.issues)
+label_rules = labelutils.LabelRules(
+    component_map, no_close_labels=no_close_labels, label_exclusions=label_exclusions)
+
+print(f'* Mapping labels of {len(issues)} synthetic issues')
+linear_results = run('Linear scans', lambda issue: map_linear(
+    issue['labels'], issue), issues)
+compiled_results = run('Compiled rules',
+                       lambda issue: label_rules.evaluate(issue['labels']), issues)
+
+# Both approaches need to agree for the comparison to mean anything
+assert linear_results == compiled_results  # results need to match
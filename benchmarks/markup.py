@@ -0,0 +1,121 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# Run from anywhere with the repo root on the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.markuputils as markuputils  # noqa: E402
+
+words = ['the', 'migration', 'fails', 'when', 'issue', 'comment', 'label', 'snake_case_name', 'Jira', 'GitHub',
+         'request', 'timeout', 'retry', 'page', 'value']
+# Inputs that make backtracking parsers blow up (unclosed delimiters repeated many times)
+adversarial_patterns = ['[', 'a*', '_a ', '**a', '![a](', 'a`', '<', '~~x', '[a](', '{', ' -a', ' ??a', ' ^a ']
+
+
+def sentence(rng):
+    """Return a line of prose with a mix of inline Markdown"""
+
+    parts = []
+    for _ in range(rng.randint(8, 20)):
+        word = rng.choice(words)
+        roll = rng.random()
+        if roll < 0.05:
+            word = f'**{word}**'
+        elif roll < 0.1:
+            word = f'_{word}_'
+        elif roll < 0.15:
+            word = f'`{word}()`'
+        elif roll < 0.18:
+            word = f'[{word}](https://example.com/{word})'
+        elif roll < 0.2:
+            word = f'~~{word}~~'
+        parts.append(word)
+
+    return ' '.join(parts)
+
+
+def synthetic_body(rng, size):
+    """Return a synthetic GitHub issue body of about size characters with every kind of block"""
+
+    blocks = []
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.1:
+            block = f'## {sentence(rng)}'
+        elif roll < 0.2:
+            block = '```python\n' + '\n'.join(f'    value = {{"key": {index}}}' for index in range(10)) + '\n```'
+        elif roll < 0.3:
+            block = '| Name | Value |\n|---|---|\n' + '\n'.join(
+                f'| {rng.choice(words)} | {sentence(rng)} |' for _ in range(5))
+        elif roll < 0.4:
+            block = '\n'.join(f'{"  " * (index % 3)}- {sentence(rng)}' for index in range(6))
+        elif roll < 0.45:
+            block = '\n'.join(f'> {sentence(rng)}' for _ in range(3))
+        elif roll < 0.5:
+            block = '<!-- Please describe\nthe problem -->\n![screenshot](https://github.com/user-attachments/assets/1)'
+        else:
+            block = '\n'.join(sentence(rng) for _ in range(4))
+        blocks.append(block)
+        length += len(block) + 2
+
+    return '\n\n'.join(blocks)
+
+
+def run(name, bodies):
+    """Time converting bodies and print the throughput"""
+
+    size = sum(len(body) for body in bodies)
+    start = time.perf_counter()
+    results = [markuputils.to_jira(body) for body in bodies]
+    elapsed = time.perf_counter() - start
+    print(f'* {name}: {elapsed:.3f}s total, {elapsed / len(bodies) * 1e6:.2f}us per body, '
+          f'{size / elapsed / 1024 / 1024:.1f}MB/s')
+
+    return results, elapsed
+
+
+description = 'Benchmark converting GitHub Markdown bodies to Jira wiki markup'
+parser = argparse.ArgumentParser(description=description)
+parser.add_argument(
+    '-n', '--bodies', type=int, default=2000,
+    help='Number of synthetic bodies to convert')
+parser.add_argument(
+    '--size', type=int, default=20000,
+    help='Approximate number of characters in each body')
+parser.add_argument(
+    '--bot-comment-size', type=int, default=2000,
+    help='Approximate number of characters in the repeated bot comment')
+parser.add_argument(
+    '--adversarial-size', type=int, default=100000,
+    help='Number of times each adversarial pattern is repeated')
+args = parser.parse_args()
+
+rng = random.Random(0)
+bodies = [synthetic_body(rng, args.size) for _ in range(args.bodies)]
+# Bot comments (such as CI reports) repeat the same body over and over
+bot_comment = synthetic_body(rng, args.bot_comment_size)
+bot_comments = [bot_comment] * args.bodies
+
+print(f'* Converting {len(bodies)} synthetic bodies of about {args.size} characters')
+markuputils.memoized_convert.cache_clear()
+run('Distinct bodies', bodies)
+bot_results, _ = run('Repeated bot comment', bot_comments)
+print(f'* Memoized {markuputils.memoized_convert.cache_info().currsize} bodies of up to '
+      f'{markuputils.memoized_body_size} characters')
+markuputils.memoized_convert.cache_clear()
+
+# Memoized conversions need to match converting from scratch
+assert bot_results[-1] == markuputils.convert(bot_comment)  # results need to match
+
+# Doubling an adversarial input should about double the time if the conversion is linear
+print(f'* Converting adversarial inputs of {args.adversarial_size} and {args.adversarial_size * 2} repetitions')
+for pattern in adversarial_patterns:
+    timings = []
+    for repetitions in (args.adversarial_size, args.adversarial_size * 2):
+        _, elapsed = run(f'{pattern!r} x {repetitions}', [pattern * repetitions])
+        timings.append(elapsed)
+    assert timings[1] < timings[0] * 4  # conversion needs to stay linear
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Run from anywhere with the benchmarks directory on the import path
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, benchmarks_dir)
+
+import fakeservers  # noqa: E402
+
+
+def write_workdir(workdir, rate_limit, repo_count):
+    """Write the config.json and migrationauth.py used by the migration into a working directory"""
+
+    config = {
+        'label_filter': fakeservers.filter_label,
+        'label_exclusions': fakeservers.excluded_label,
+        'completion_label': 'migrated',
+        'squad_completion_label': 'squad-migrated',
+        'component_name': 'Benchmark',
+        'default_jira_user': 'default',
+        'user_map': {},
+        'component_map': fakeservers.components,
+        'rate_limits': {
+            'github': rate_limit,
+            'github_search': rate_limit,
+            'jira': rate_limit,
+            'zenhub': rate_limit
+        }
+    }
+    if repo_count > 1:
+        config['repos'] = [f'stolostron/backlog-{index}' for index in range(repo_count)]
+    config_file = open(os.path.join(workdir, 'config.json'), 'w')
+    json.dump(config, config_file, indent=2)
+    config_file.close()
+
+    auth_file = open(os.path.join(workdir, 'migrationauth.py'), 'w')
+    auth_file.write("GH_USERNAME = 'benchmark'\nGH_TOKEN = 'benchmark'\n"
+                    "ZENHUB_TOKEN = 'benchmark'\nJIRA_TOKEN = 'benchmark'\n")
+    auth_file.close()
+
+
+def run(issue_count, args):
+    """Migrate a synthetic repo from the fake services and return the measurements"""
+
+    services = fakeservers.FakeServices(
+        issue_count // args.repos, comment_count=args.comments, latency=args.latency_ms / 1000,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        attachment_rate=args.attachment_rate)
+    server = fakeservers.start(services)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    workdir = tempfile.mkdtemp(prefix=f'migration-benchmark-{issue_count}-')
+    write_workdir(workdir, args.rate_limit, args.repos)
+    log_path = os.path.join(workdir, 'migration.log')
+    log_file = open(log_path, 'w')
+
+    command = [sys.executable, os.path.join(benchmarks_dir, 'run_migration.py'), base_url]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command + args.migration_args, cwd=workdir, stdout=log_file, stderr=subprocess.STDOUT)
+    # wait4 returns the resource usage of the migration process alone
+    _, wait_status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(wait_status)
+    log_file.close()
+
+    server.shutdown()
+    server.server_close()
+
+    with services.lock:
+        counts = dict(sorted(services.counts.items()))
+    result = {
+        'issues': issue_count,
+        'created': len(services.jira_issues),
+        'exit_code': process.returncode,
+        'seconds': round(elapsed, 3),
+        'issues_per_second': round(issue_count // args.repos * args.repos / elapsed, 2),
+        'requests': sum(count for endpoint, count in counts.items()
+                        if not endpoint.startswith(('injected', 'GraphQL'))),
+        # ru_maxrss is in kilobytes on Linux (and bytes on macOS)
+        'peak_rss_mb': round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'endpoints': counts
+    }
+
+    if process.returncode != 0 or args.keep:
+        result['log'] = log_path
+    else:
+        shutil.rmtree(workdir)
+
+    return result
+
+
+def print_result(result):
+    """Print the measurements of a run"""
+
+    print(f'* {result["issues"]} issues: {result["issues_per_second"]} issues/sec, {result["seconds"]}s, '
+          f'{result["requests"]} requests, {result["peak_rss_mb"]} MB peak RSS, '
+          f'{result["created"]} Jira issues created, exit code {result["exit_code"]}')
+    for endpoint, count in result['endpoints'].items():
+        print(f'  {count:>8} {endpoint}')
+    if 'log' in result:
+        print(f'  Log: {result["log"]}')
+
+
+description = 'Benchmark jira-migration.py end to end against local fake GitHub, Jira, and ZenHub services'
+parser = argparse.ArgumentParser(
+    description=description,
+    epilog='Arguments after -- are passed to jira-migration.py, e.g. -- --workers 8 --concurrency 8')
+parser.add_argument(
+    '--sizes', default='1000,10000,50000',
+    help='Comma separated numbers of synthetic issues to migrate (one run each)')
+parser.add_argument(
+    '--repos', type=int, default=1,
+    help='Number of repos to spread the synthetic issues of each run over (migrated in separate processes)')
+parser.add_argument(
+    '--comments', type=int, default=2,
+    help='Number of comments on each synthetic issue')
+parser.add_argument(
+    '--attachment-rate', type=float, default=0,
+    help='Fraction of synthetic issues with a screenshot pasted into the body (migrated with -- --attachments)')
+parser.add_argument(
+    '--latency-ms', type=float, default=0,
+    help='Latency added to every response of the fake services')
+parser.add_argument(
+    '--error-rate', type=float, default=0,
+    help='Fraction of requests answered with 500')
+parser.add_argument(
+    '--rate-limit-rate', type=float, default=0,
+    help='Fraction of requests answered with 429 and Retry-After')
+parser.add_argument(
+    '--retry-after', type=int, default=1,
+    help='Seconds sent in the Retry-After header of injected 429s')
+parser.add_argument(
+    '--rate-limit', type=float, default=100000,
+    help='Requests per second the migration paces each service to')
+parser.add_argument(
+    '--keep', default=False, action='store_true',
+    help='Keep the working directory (with the migration log) of every run')
+parser.add_argument(
+    '--output',
+    help='JSON file to write the results to for tracking regressions')
+parser.add_argument(
+    'migration_args', nargs=argparse.REMAINDER,
+    help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+if args.migration_args[:1] == ['--']:
+    args.migration_args = args.migration_args[1:]
+
+results = []
+failed_sizes = []
+for size in args.sizes.split(','):
+    print(f'* Migrating {size} synthetic issues')
+    result = run(int(size), args)
+    # The measurements of a migration that didn't finish aren't comparable to anything
+    if result['exit_code'] != 0:
+        print(f'* Error: migrating {size} issues exited with code {result["exit_code"]}, see {result["log"]}')
+        failed_sizes.append(size)
+        continue
+    print_result(result)
+    results.append(result)
+
+if args.output:
+    output_file = open(args.output, 'w')
+    json.dump({'migration_args': args.migration_args, 'results': results},
+              output_file, indent=2)
+    output_file.close()
+
+if len(failed_sizes) > 0:
+    exit(1)
@@ -0,0 +1,49 @@
+import os
+from requests.adapters import HTTPAdapter
+import runpy
+import sys
+
+# Run jira-migration.py against the fake services at a base URL:
+#   python run_migration.py <base URL> [migration arguments]
+# from a working directory with config.json and migrationauth.py (set up by benchmarks/migration.py)
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.getcwd(), repo_root]
+
+import utils.attachmentutils as attachmentutils  # noqa: E402
+import utils.ghutils as ghutils  # noqa: E402
+import utils.httputils as httputils  # noqa: E402
+import utils.jirautils as jirautils  # noqa: E402
+import utils.zenhubutils as zenhubutils  # noqa: E402
+
+base_url = sys.argv[1]
+
+# Point every service URL at the fake services
+ghutils.api_url = f'{base_url}/github'
+ghutils.root_url = f'{ghutils.api_url}/repos'
+ghutils.base_url = f'{ghutils.root_url}/{ghutils.org_repo}/issues'
+ghutils.graphql_url = f'{ghutils.api_url}/graphql'
+ghutils.search_url = f'{ghutils.api_url}/search/issues'
+jirautils.root_url = f'{base_url}/jira'
+jirautils.base_url = f'{jirautils.root_url}/rest/api/latest'
+jirautils.html_url = f'{jirautils.root_url}/browse'
+jirautils.issue_url = f'{jirautils.base_url}/issue'
+zenhubutils.base_url = f'{base_url}/zenhub/graphql'
+
+
+class FakeFilesAdapter(HTTPAdapter):
+    """Send requests for files uploaded to GitHub to the fake services instead"""
+
+    def send(self, request, **kwargs):
+        request.url = request.url.replace('https://github.com/', f'{base_url}/github/', 1)
+        return super().send(request, **kwargs)
+
+
+# Pasted files are referenced by their github.com URLs in issue bodies, and downloaded with the
+# session attachmentutils registers (this adapter isn't replaced when the pool is resized since
+# it's mounted for a longer prefix)
+httputils.sessions[attachmentutils.files_service].mount(
+    'https://github.com/', FakeFilesAdapter())
+
+sys.argv = ['jira-migration.py'] + sys.argv[2:]
+runpy.run_path(os.path.join(repo_root, 'jira-migration.py'),
+               run_name='__main__')
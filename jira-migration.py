@@ -1,7 +1,23 @@
+import utils.applyutils as applyutils
+import utils.attachmentutils as attachmentutils
+import utils.cacheutils as cacheutils
+import utils.cassetteutils as cassetteutils
 import utils.ghutils as ghutils
+import utils.journalutils as journalutils
+import utils.labelutils as labelutils
+import utils.metricsutils as metricsutils
+import utils.httputils as httputils
 import utils.jirautils as jirautils
 import utils.migrationutils as migrationutils
+import utils.pipelineutils as pipelineutils
+import utils.syncutils as syncutils
+import utils.zenhubutils as zenhubutils
+from concurrent.futures import ProcessPoolExecutor
 import json
+import itertools
+import multiprocessing
+import os
+import time
 from pprint import pprint
 import argparse
 
@@ -23,9 +39,21 @@ except:
 
 user_map = {}
 component_map = {}
+type_map = labelutils.default_type_map
+priority_map = labelutils.default_priority_map
+severity_map = labelutils.default_severity_map
+no_close_labels = labelutils.default_no_close_labels
 if config_json:
     if 'component_map' in config_json:
         component_map = config_json['component_map']
+    if 'type_map' in config_json:
+        type_map = config_json['type_map']
+    if 'priority_map' in config_json:
+        priority_map = config_json['priority_map']
+    if 'severity_map' in config_json:
+        severity_map = config_json['severity_map']
+    if 'no_close_labels' in config_json:
+        no_close_labels = config_json['no_close_labels']
     if user_map_json:
         user_map = user_map_json
     elif 'user_map' in config_json:
@@ -44,6 +72,25 @@ label_exclusions = ''
 completion_label = ''
 squad_completion_label = ''
 component_name = ''
+user_cache_file = 'user_cache.sqlite'
+user_cache_ttl_hours = 24
+user_cache_size = 10000
+metadata_cache_file = 'metadata_cache.sqlite'
+metadata_cache_ttl_hours = 24
+pool_size = httputils.pool_size
+http_cache_file = 'http_cache.sqlite'
+http_cache_size_mb = 512
+sync_state_file = 'sync_state.sqlite'
+attachment_cache_file = 'attachment_cache.sqlite'
+# GitHub repos to migrate, each with optional label_filter, label_exclusions, and component_map overrides
+repos = [{'repo': ghutils.org_repo}]
+# Requests per second to each service (adjusted down further from rate limit headers)
+rate_limits = {
+    'github': 10,
+    'github_search': 30 / 60,
+    'jira': 20,
+    'zenhub': 100 / 60,
+}
 
 # Parse config file
 if 'label_filter' in config_json:
@@ -56,6 +103,34 @@ if 'squad_completion_label' in config_json:
     squad_completion_label = config_json['squad_completion_label']
 if 'component_name' in config_json:
     component_name = config_json['component_name']
+if 'user_cache_file' in config_json:
+    user_cache_file = config_json['user_cache_file']
+if 'user_cache_ttl_hours' in config_json:
+    user_cache_ttl_hours = config_json['user_cache_ttl_hours']
+if 'user_cache_size' in config_json:
+    user_cache_size = config_json['user_cache_size']
+if 'metadata_cache_file' in config_json:
+    metadata_cache_file = config_json['metadata_cache_file']
+if 'metadata_cache_ttl_hours' in config_json:
+    metadata_cache_ttl_hours = config_json['metadata_cache_ttl_hours']
+if 'http_pool_size' in config_json:
+    pool_size = config_json['http_pool_size']
+if 'rate_limits' in config_json:
+    rate_limits.update(config_json['rate_limits'])
+if 'http_cache_file' in config_json:
+    http_cache_file = config_json['http_cache_file']
+if 'http_cache_size_mb' in config_json:
+    http_cache_size_mb = config_json['http_cache_size_mb']
+if 'sync_state_file' in config_json:
+    sync_state_file = config_json['sync_state_file']
+if 'attachment_cache_file' in config_json:
+    attachment_cache_file = config_json['attachment_cache_file']
+if 'repos' in config_json:
+    repos = []
+    for repo_config in config_json['repos']:
+        if isinstance(repo_config, str):
+            repo_config = {'repo': repo_config}
+        repos.append(repo_config)
 
 # Parse CLI arguments (these override the config file)
 description = 'Utility to migrate issues from GitHub to Jira'
@@ -83,6 +158,107 @@ parser.add_argument(
     '--dry-run',
     default=False, action='store_true',
     help='Only run get operations and don\'t update/create issues')
+parser.add_argument(
+    '--refresh-user-cache',
+    default=False, action='store_true',
+    help='Discard cached Jira user lookups and query Jira again')
+parser.add_argument(
+    '--pool-size', type=int,
+    help='Number of keep-alive connections pooled per service')
+parser.add_argument(
+    '--workers', type=int, default=1,
+    help='Number of GitHub issues to map concurrently')
+parser.add_argument(
+    '--concurrency', type=int, default=1,
+    help='Number of Jira issues to create and update concurrently')
+parser.add_argument(
+    '--comment-concurrency', type=int, default=1,
+    help='Number of comments to post concurrently per Jira issue (comments may be out of order if greater than 1)')
+parser.add_argument(
+    '--prefetch-linked-issues',
+    default=False, action='store_true',
+    help='Index Jira issues already linked to GitHub issues up front instead of searching Jira for each issue')
+parser.add_argument(
+    '--linked-issues-file',
+    help='JSON file to save the linked issue index to (or to load it from without --prefetch-linked-issues)')
+parser.add_argument(
+    '--skip-duplicates',
+    default=False, action='store_true',
+    help='Don\'t create Jira issues for GitHub issues that are already linked to a Jira issue')
+parser.add_argument(
+    '--bulk-create',
+    default=False, action='store_true',
+    help='Create Jira issues in chunks using the bulk create endpoint')
+parser.add_argument(
+    '--bulk-size', type=int, default=jirautils.bulk_create_limit,
+    help=f'Number of Jira issues per bulk create request (at most {jirautils.bulk_create_limit})')
+parser.add_argument(
+    '--zenhub-snapshot',
+    default=False, action='store_true',
+    help='Index ZenHub data for the whole workspace up front instead of querying ZenHub for each issue')
+parser.add_argument(
+    '--journal', default='migration_journal.jsonl',
+    help='File to record the completed migration stages of each issue in')
+parser.add_argument(
+    '--resume',
+    default=False, action='store_true',
+    help='Resume an interrupted migration from the journal, skipping stages that were already completed')
+parser.add_argument(
+    '--fresh',
+    default=False, action='store_true',
+    help='Start a new journal when one from an earlier migration exists (the old one is kept with a timestamp suffix)')
+parser.add_argument(
+    '--no-http-cache',
+    default=False, action='store_true',
+    help='Always download GitHub issues and comments instead of revalidating cached copies')
+parser.add_argument(
+    '--graphql',
+    default=False, action='store_true',
+    help='Fetch GitHub issues together with their comments using the GraphQL API')
+parser.add_argument(
+    '--search',
+    default=False, action='store_true',
+    help='Fetch GitHub issues with the search API, which leaves out excluded labels and pull requests on GitHub\'s side')
+parser.add_argument(
+    '--refresh-metadata-cache',
+    default=False, action='store_true',
+    help='Discard cached Jira project metadata and query Jira again')
+parser.add_argument(
+    '--metrics-file',
+    help='JSON file to write request and stage metrics to at the end (also written in the Prometheus text format with .prom)')
+parser.add_argument(
+    '--progress-interval', type=float, default=metricsutils.progress_interval,
+    help='Seconds in between progress lines with the ETA (0 to disable)')
+parser.add_argument(
+    '--processes', type=int,
+    help='Number of repos from the repos config to migrate at once in separate processes (default: one per repo, up to the number of CPUs)')
+parser.add_argument(
+    '--sync',
+    default=False, action='store_true',
+    help='Update Jira issues already migrated with the fields and comments that changed on GitHub since the last run')
+parser.add_argument(
+    '--fold-comments', type=int, metavar='KB',
+    help='Fold GitHub comments into as few Jira comments of up to this many KB as possible, keeping each comment\'s author and date header')
+parser.add_argument(
+    '--write-back-batch-size', type=int, default=0,
+    help=f'Number of GitHub issues to comment on, label, and close in each GraphQL request (at most {ghutils.write_back_batch_limit}, 0 uses a REST request for each)')
+parser.add_argument(
+    '--attachments',
+    default=False, action='store_true',
+    help='Copy files pasted into GitHub issues and comments to the Jira issue\'s attachments and link to them there')
+parser.add_argument(
+    '--raw-markdown',
+    default=False, action='store_true',
+    help='Copy GitHub Markdown into Jira as is instead of converting it to Jira wiki markup')
+parser.add_argument(
+    '--attachment-concurrency', type=int, default=attachmentutils.concurrency,
+    help='Number of attachments to download and upload at once')
+parser.add_argument(
+    '--record', metavar='CASSETTE',
+    help='Record the responses to every GitHub, ZenHub, and Jira read to a cassette file to replay later')
+parser.add_argument(
+    '--replay', metavar='CASSETTE',
+    help='Answer every request from a cassette file recorded with --record instead of the network (needs --dry-run)')
 args = parser.parse_args()
 
 if args.label_filter:
@@ -95,25 +271,143 @@ if args.squad_completion_label:
     squad_completion_label = args.squad_completion_label
 if args.component_name:
     component_name = args.component_name
+if args.pool_size:
+    pool_size = args.pool_size
+
+metricsutils.progress_interval = args.progress_interval
+
+if args.workers < 1 or args.concurrency < 1 or args.comment_concurrency < 1 or args.attachment_concurrency < 1:
+    print('* Error: --workers, --concurrency, --comment-concurrency, and --attachment-concurrency must be at least 1.')
+    exit(1)
+if args.graphql and args.search:
+    print('* Error: --graphql and --search can\'t be used together.')
+    exit(1)
+if args.resume and args.fresh:
+    print('* Error: --resume and --fresh can\'t be used together.')
+    exit(1)
+if args.record and args.replay:
+    print('* Error: --record and --replay can\'t be used together.')
+    exit(1)
+if args.replay and not args.dry_run:
+    print('* Error: --replay only works with --dry-run since writes aren\'t recorded.')
+    exit(1)
+if args.replay and not os.path.exists(args.replay):
+    print(f'* Error: Cassette {args.replay} not found. Record it first with --record.')
+    exit(1)
+if len(repos) == 0:
+    print('* Error: The repos list in config.json is empty.')
+    exit(1)
+processes = args.processes or min(len(repos), os.cpu_count() or 1)
+if processes < 1:
+    print('* Error: --processes must be at least 1.')
+    exit(1)
+processes = min(processes, len(repos))
+if args.fold_comments is not None and args.fold_comments < 1:
+    print('* Error: --fold-comments must be at least 1.')
+    exit(1)
+if not 0 <= args.write_back_batch_size <= ghutils.write_back_batch_limit:
+    print(
+        f'* Error: --write-back-batch-size must be between 0 and {ghutils.write_back_batch_limit}.')
+    exit(1)
+if not 0 < args.bulk_size <= jirautils.bulk_create_limit:
+    print(
+        f'* Error: --bulk-size must be between 1 and {jirautils.bulk_create_limit}.')
+    exit(1)
 
-# Collect GitHub issues using query config or CLI
-label_exclusions = f'{completion_label},{squad_completion_label},{label_exclusions}'
-gh_issues = ghutils.get_issues_by_label(label_filter, label_exclusions)
+# Reuse pooled keep-alive connections to GitHub, Jira, and ZenHub for the whole run
+# (with at least one connection per worker so workers don't wait on the pool)
+httputils.set_pool_size(max(
+    pool_size, args.workers, args.concurrency * args.comment_concurrency))
 
-jira_mappings = []
+applyutils.dry_run = args.dry_run
+applyutils.verbose = args.verbose
+applyutils.component_name = component_name
+applyutils.completion_label = completion_label
+applyutils.squad_completion_label = squad_completion_label
+applyutils.issue_concurrency = args.concurrency
+applyutils.comment_concurrency = args.comment_concurrency
+applyutils.skip_duplicates = args.skip_duplicates
+applyutils.bulk_create = args.bulk_create
+applyutils.bulk_size = args.bulk_size
+applyutils.write_back_batch_size = args.write_back_batch_size
+applyutils.migrate_attachments = args.attachments
+attachmentutils.concurrency = args.attachment_concurrency
+migrationutils.convert_markdown = not args.raw_markdown
+syncutils.dry_run = args.dry_run
+syncutils.verbose = args.verbose
 
-if len(gh_issues) == 0:
-    print('* No issues were returned from GitHub:')
-    print(f'  Label filter:     {label_filter}')
-    print(f'  Label exclusions: {label_exclusions}')
+# Jira rejects longer comments, so folded comments are capped at its limit
+if args.fold_comments is not None:
+    fold_size = min(args.fold_comments * 1024,
+                    jirautils.max_comment_length)
+    applyutils.fold_size = fold_size
+    syncutils.fold_size = fold_size
 
-# Iterate over GitHub issues and collect mapping objects
-for gh_issue in gh_issues:
-    gh_url = gh_issue['html_url']
-    print(f'* Creating Jira mapping for {gh_url} ({gh_issue["title"]})')
+# Pace requests to stay under each service's rate limits, waiting instead of failing when they run out
+# (the limits are shared out between the processes migrating repos at once)
+for service in rate_limits:
+    httputils.set_rate_limit(service, rate_limits[service] / processes)
+
+# Cache GitHub GET responses so unchanged issue pages and comments come back as cheap 304s
+if not args.no_http_cache:
+    httputils.enable_response_cache('github', cacheutils.Cache(
+        http_cache_file, 'github_responses',
+        max_entries=100000, max_bytes=http_cache_size_mb * 1024 * 1024))
+
+# Cache Jira user lookups across runs since the same users appear on many issues
+migrationutils.user_cache = cacheutils.Cache(
+    user_cache_file, 'jira_users',
+    ttl=user_cache_ttl_hours * 60 * 60, max_entries=user_cache_size)
+
+# Keep the Jira project's create metadata across runs to validate mappings against
+jirautils.meta_cache = cacheutils.Cache(
+    metadata_cache_file, 'jira_metadata', ttl=metadata_cache_ttl_hours * 60 * 60)
+
+# Save every read response to a cassette, or answer requests from one without touching the network
+if args.record:
+    httputils.cassette = cassetteutils.Cassette(args.record)
+elif args.replay:
+    httputils.cassette = cassetteutils.Cassette(args.replay, replaying=True)
+
+# Remember where each GitHub file went (by URL and by content) so it's only uploaded to Jira once
+if args.attachments:
+    attachmentutils.url_cache = cacheutils.Cache(
+        attachment_cache_file, 'attachment_urls')
+    attachmentutils.hash_cache = cacheutils.Cache(
+        attachment_cache_file, 'attachment_hashes')
+
+# Keep what was last sent to Jira for each issue so syncs only send what changed since
+syncutils.issue_state = cacheutils.Cache(sync_state_file, 'sync_issues')
+syncutils.watermarks = cacheutils.Cache(sync_state_file, 'sync_watermarks')
+
+
+def journal_path(repo):
+    """Return the journal file for a repo (one per repo when migrating several)"""
+
+    if len(repos) == 1:
+        return args.journal
+
+    journal_root, journal_ext = os.path.splitext(args.journal)
+    return f'{journal_root}.{repo.replace("/", "_")}{journal_ext}'
+
+
+def exclude_issues(gh_issue_pages, label_rules):
+    """Yield pages of GitHub issues without the ones the label rules exclude"""
+
+    for page in gh_issue_pages:
+        yield [gh_issue for gh_issue in page if not label_rules.evaluate(gh_issue['labels'])['excluded']]
+
+
+def map_issue(gh_issue, label_rules):
+    """Return the mapping object for a GitHub issue and its comments"""
+
+    # Reuse the mapping from an interrupted run
+    state = applyutils.journal_state(gh_issue['html_url'])
+    if 'mapped' in state:
+        return state['mapped']
 
     jira_issue_input, can_close = migrationutils.issue_map(
-        gh_issue, component_map, user_map, default_user)
+        gh_issue, label_rules, user_map, default_user)
 
     # Collect comments from the GitHub issue
     gh_comments = ghutils.get_issue_comments(gh_issue)
@@ -122,111 +416,463 @@ for gh_issue in gh_issues:
         jira_comment_input.append(
             migrationutils.comment_map(comment))
 
-    # Store issue mapping objects
     mapping_obj = {
         'gh_issue_number': gh_issue['number'],
+        'gh_node_id': gh_issue['node_id'],
         'issue': jira_issue_input,
         'comments': jira_comment_input,
+        'comment_ids': [comment['id'] for comment in gh_comments],
         'close_gh_issue': can_close
     }
-    jira_mappings.append(mapping_obj)
+    applyutils.record(gh_issue['html_url'], 'mapped', mapping_obj)
 
-    if args.verbose:
-        pprint(mapping_obj)
+    return mapping_obj
 
-# Iterate over Jira mappings to create issues with comments
-issue_failures = []
-duplicate_issues = {}
-for jira_map in jira_mappings:
-    gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
-    gh_issue_title = jira_map['issue']['summary']
-    print(
-        '* Checking for issues already linked to GitHub issue ' +
-        f'{gh_issue_url} ({gh_issue_title})')
 
-    custom_field_index = jirautils.gh_issue_field.split('_')[1]
-    custom_field = f'cf[{custom_field_index}]'
-    duplicate_list = jirautils.search_issues(
-        f'{custom_field} = "{gh_issue_url}"')['issues']
-    if len(duplicate_list) > 0:
-        duplicate_issues[gh_issue_url] = list(
-            map(lambda issue: issue['key'], duplicate_list))
+def is_valid(mapping_obj, report):
+    """Whether a mapping passes validation against the Jira create metadata, recording it in the report if not"""
 
-    print(
-        f'* Creating Jira issue for {gh_issue_url} ({gh_issue_title})')
+    # Catch values Jira would reject before sending anything
+    validation_errors = jirautils.validate_issue(mapping_obj['issue'])
+    if len(validation_errors) > 0:
+        gh_url = mapping_obj['issue'][jirautils.gh_issue_field]
+        print(f'* Error: Invalid Jira mapping for {gh_url}:')
+        for validation_error in validation_errors:
+            print(f'  {validation_error}')
+        report['invalid'][gh_url] = validation_errors
+        return False
 
-    jira_api_url = ''
-    jira_key = ''
-    if not args.dry_run:
-        create_response = jirautils.create_issue(jira_map["issue"])
-        if args.verbose:
-            pprint(create_response)
-        if 'self' in create_response:
-            jira_api_url = create_response['self']
-        if 'key' in create_response:
-            jira_key = create_response['key']
-
-    if not args.dry_run and jira_key == '':
-        print('* Error: A Jira key was not returned in the creation response')
-        issue_failures.append(gh_issue_url)
-        continue
-
-    print(f'* Adding comments from GitHub to new Jira issue {jira_key}')
-
-    if not args.dry_run:
-        for comment_map in jira_map['comments']:
-            comment_response = jirautils.add_comment_from_url(
-                f'{jira_api_url}/comment', comment_map)
-            if args.verbose:
-                pprint(comment_response)
+    return True
+
+
+def map_issues(gh_issues, label_rules, report):
+    """Yield mapping objects for GitHub issues, mapping several issues at once"""
+
+    seen_issue_urls = set()
+
+    # Issues are mapped concurrently, but results are yielded in the order GitHub returned them
+    for gh_issue, mapping_obj in pipelineutils.ordered_map(
+            lambda gh_issue: map_issue(gh_issue, label_rules), gh_issues, args.workers):
+        report['issue_count'] += 1
+        gh_url = gh_issue['html_url']
+        seen_issue_urls.add(gh_url)
+        metricsutils.stage('map')
+        if args.resume and applyutils.journal is not None and applyutils.journal.is_complete(gh_url):
+            print(f'* Skipping already migrated issue {gh_url}')
+            metricsutils.stage('finished')
+            continue
+        print(f'* Created Jira mapping for {gh_url} ({gh_issue["title"]})')
 
-    print(
-        f'* Adjusting status of Jira issue to match ZenHub pipeline {jira_key}')
-    if not args.dry_run:
-        if jira_map['issue']['status']:
-            transition_response = jirautils.do_transition(
-                jira_key, jira_map['issue']['status'])
-            if args.verbose:
-                pprint(transition_response)
-
-    # Add comment in GH issue with link to new Jira issue
-    gh_issue_number = jira_map['gh_issue_number']
-    jira_html_url = f'{jirautils.html_url}/{jira_key}'
-    gh_comment = 'This issue has been migrated to Jira'
-    if component_name != '':
-        gh_comment += f' for {component_name}'
-    gh_comment += f': {jira_html_url}'
-
-    if not args.dry_run:
-        comment_response = ghutils.add_issue_comment(
-            gh_issue_number, gh_comment)
         if args.verbose:
-            pprint(comment_response)
-
-    # Add migration label and close GH issue if allowed
-    print('* Handling GitHub issue labels and closing issue if allowed')
-    if not args.dry_run:
-        if jira_map['close_gh_issue']:
-            label_response = ghutils.add_issue_label(
-                gh_issue_number, completion_label)
-            if args.verbose:
-                pprint(label_response)
-            close_response = ghutils.close_issue(gh_issue_number)
-            if args.verbose:
-                pprint(close_response)
+            pprint(mapping_obj)
+
+        if is_valid(mapping_obj, report):
+            yield mapping_obj
+        else:
+            metricsutils.stage('finished')
+
+    # Finish issues from an interrupted run that GitHub no longer returns (e.g. labelled but not closed)
+    if args.resume and applyutils.journal is not None:
+        for mapping_obj in applyutils.journal.incomplete_mappings(seen_issue_urls):
+            print(
+                f'* Resuming journaled issue {mapping_obj["issue"][jirautils.gh_issue_field]}')
+            if is_valid(mapping_obj, report):
+                yield mapping_obj
+
+
+def sync_issue(gh_issue, label_rules, report):
+    """Sync the changes to a GitHub issue since it was last migrated or synced to its Jira issue, returning the counts"""
+
+    gh_url = gh_issue['html_url']
+    mapping_obj = map_issue(gh_issue, label_rules)
+
+    state = syncutils.get_state(gh_url)
+    if state is None:
+        # Issues migrated before the sync state was kept are found by their link and synced in full
+        if applyutils.linked_issues is not None:
+            jira_keys = applyutils.linked_issues.get(gh_url, [])
+        else:
+            search_response = jirautils.search_issues(
+                f'{jirautils.gh_issue_jql_field} = "{gh_url}"', [jirautils.gh_issue_field])
+            if not 'issues' in search_response:
+                print(f'* Error: Jira issues linked to {gh_url} could not be searched: {search_response}')
+                report['failures'].append(gh_url)
+                return None
+            jira_keys = [issue['key'] for issue in search_response['issues']]
+        if len(jira_keys) == 0:
+            print(f'* Skipping GitHub issue that hasn\'t been migrated: {gh_url}')
+            report['unmigrated'].append(gh_url)
+            return None
+        if len(jira_keys) > 1:
+            report['duplicates'][gh_url] = jira_keys
+        state = {'key': jira_keys[0], 'fields': {}, 'comment_ids': None}
+
+    if not is_valid(mapping_obj, report):
+        return None
+
+    # Link to the Jira copies of GitHub files, as the migrated description and comments do
+    if args.attachments:
+        urls = attachmentutils.mapping_urls(mapping_obj)
+        if args.dry_run:
+            url_map = attachmentutils.known_attachments(urls)
+        else:
+            url_map = attachmentutils.migrate_attachments(state['key'], urls)
+        mapping_obj = attachmentutils.rewrite_mapping(mapping_obj, url_map)
+
+    return syncutils.sync_issue(state['key'], mapping_obj, state)
+
+
+def sync_issues(gh_issues, label_rules, report):
+    """Sync GitHub issues to their Jira issues, syncing several issues at once"""
+
+    for gh_issue, result in pipelineutils.ordered_map(
+            lambda gh_issue: sync_issue(gh_issue, label_rules, report), gh_issues, args.workers):
+        report['issue_count'] += 1
+        metricsutils.stage('map')
+        metricsutils.stage('finished')
+        if result is None:
+            continue
+        if result['failed']:
+            report['failures'].append(gh_issue['html_url'])
+        if result['fields'] > 0 or result['comments'] > 0:
+            report['synced_issues'] += 1
+        report['synced_fields'] += result['fields']
+        report['synced_comments'] += result['comments']
+
+
+def migrate_repo(repo_config):
+    """Migrate the issues of a GitHub repo and return a report of the results"""
+
+    repo = repo_config['repo']
+    ghutils.set_repo(repo)
+    if len(repos) > 1:
+        print(f'* Migrating issues from {repo}')
+        metricsutils.progress_label = repo
+
+    # CLI arguments override the repo's config, which overrides the top-level config
+    repo_label_filter = args.label_filter or repo_config.get(
+        'label_filter', label_filter)
+    repo_label_exclusions = args.label_exclusions or repo_config.get(
+        'label_exclusions', label_exclusions)
+    # Syncs are for issues that were already migrated, so they're only excluded when migrating
+    if not args.sync:
+        repo_label_exclusions = f'{completion_label},{squad_completion_label},{repo_label_exclusions}'
+    repo_component_map = dict(
+        component_map, **repo_config.get('component_map', {}))
+    # Compile the label mappings once into a table that's evaluated in one pass per issue
+    label_rules = labelutils.LabelRules(
+        repo_component_map, type_map, priority_map, severity_map, no_close_labels, repo_label_exclusions)
+
+    report = {
+        'repo': repo,
+        'issue_count': 0,
+        'invalid': {},
+        'failures': [],
+        'duplicates': {},
+        'comment_failures': [],
+        'transition_failures': [],
+        'write_back_failures': {},
+        'unmigrated': [],
+        'synced_issues': 0,
+        'synced_fields': 0,
+        'synced_comments': 0
+    }
+
+    # Record each completed stage so an interrupted migration can be resumed (dry runs aren't recorded)
+    applyutils.journal = None
+    if not args.dry_run and not args.sync:
+        applyutils.journal = journalutils.Journal(
+            journal_path(repo), resume=args.resume)
+
+    metricsutils.expected_issues = None
+
+    # Issues updated while this run is going are picked up again by the next sync
+    watermark = syncutils.new_watermark()
+
+    if args.sync:
+        since = syncutils.get_watermark(repo)
+        if since:
+            print(f'* Syncing issues from {repo} updated since {since}')
+        else:
+            print(f'* Syncing all issues from {repo} (no previous run was recorded)')
+        # Closed issues are included since their status changes need to be synced too
+        if args.search:
+            gh_issue_pages = ghutils.iter_issues_by_search(
+                repo_label_filter, repo_label_exclusions, since=since, state='all')
+        else:
+            gh_issue_pages = ghutils.iter_issues_by_label(
+                repo_label_filter, since=since, state='all')
+        gh_issue_pages = pipelineutils.prefetch(
+            exclude_issues(gh_issue_pages, label_rules))
+        gh_issues = itertools.chain.from_iterable(
+            metricsutils.counted(gh_issue_pages, 'fetch', len))
+        metricsutils.start_progress()
+        try:
+            sync_issues(gh_issues, label_rules, report)
+        finally:
+            metricsutils.stop_progress()
+        if not args.dry_run and len(report['failures']) == 0 and len(report['invalid']) == 0:
+            syncutils.set_watermark(repo, watermark)
+        return report
+
+    # Stream GitHub issues through the stages: fetch pages -> filter -> map -> apply.
+    # Each stage runs ahead of the next into a bounded queue, so the next page is
+    # fetched and mapped while the issues of the current page are created in Jira.
+    if args.graphql:
+        gh_issue_pages = ghutils.iter_issues_by_label_graphql(
+            repo_label_filter)
+    elif args.search:
+        gh_issue_pages = ghutils.iter_issues_by_search(
+            repo_label_filter, repo_label_exclusions)
+    else:
+        gh_issue_pages = ghutils.iter_issues_by_label(repo_label_filter)
+    # Issues with excluded labels are dropped as each page is fetched
+    gh_issue_pages = pipelineutils.prefetch(
+        exclude_issues(gh_issue_pages, label_rules))
+    gh_issues = itertools.chain.from_iterable(
+        metricsutils.counted(gh_issue_pages, 'fetch', len))
+    jira_mappings = pipelineutils.prefetch(
+        map_issues(gh_issues, label_rules, report))
+
+    # Create Jira issues with comments from the mappings, applying several issues at once
+    metricsutils.start_progress()
+    try:
+        apply_results = applyutils.apply_all(jira_mappings)
+    finally:
+        metricsutils.stop_progress()
+    report['failures'] = apply_results['failures']
+    report['duplicates'] = apply_results['duplicates']
+    report['comment_failures'] = apply_results['comment_failures']
+    report['transition_failures'] = apply_results['transition_failures']
+    report['write_back_failures'] = apply_results['write_back_failures']
+    if applyutils.journal is not None:
+        applyutils.journal.close()
+    if (not args.dry_run and len(report['failures']) == 0 and len(report['invalid']) == 0 and
+            len(report['comment_failures']) == 0 and len(report['transition_failures']) == 0):
+        syncutils.set_watermark(repo, watermark)
+
+    if report['issue_count'] == 0:
+        print(f'* No issues were returned from GitHub for {repo}:')
+        print(f'  Label filter:     {repo_label_filter}')
+        print(f'  Label exclusions: {repo_label_exclusions}')
+
+    return report
+
+
+def service_urls():
+    """Return the service URLs of the GitHub, Jira, and ZenHub modules"""
+
+    return {module.__name__: {name: value for name, value in vars(module).items()
+                              if name.endswith('_url') and isinstance(value, str)}
+            for module in [ghutils, jirautils, zenhubutils]}
+
+
+def init_worker(shared):
+    """Set up a worker process with the data preloaded by the main process"""
+
+    # Service URLs may have been pointed somewhere else than the module defaults
+    for module in [ghutils, jirautils, zenhubutils]:
+        for name, value in shared['service_urls'][module.__name__].items():
+            setattr(module, name, value)
+
+    jirautils.project_meta = shared['project_meta']
+    zenhubutils.snapshot = shared['zenhub_snapshot']
+    if shared['linked_issues'] is not None:
+        applyutils.linked_issues = {gh_url: list(keys)
+                                    for gh_url, keys in shared['linked_issues'].items()}
+
+
+def run_worker(repo_config):
+    """Migrate a repo in a worker process and return its report with the metrics and newly linked issues"""
+
+    initial_linked_issues = None
+    if applyutils.linked_issues is not None:
+        initial_linked_issues = {gh_url: list(keys)
+                                 for gh_url, keys in applyutils.linked_issues.items()}
+
+    # Each repo's metrics are sent back separately to be merged by the main process
+    metricsutils.reset()
+    report = migrate_repo(repo_config)
+    report['metrics'] = metricsutils.snapshot()
+
+    report['linked_issues'] = {}
+    if applyutils.linked_issues is not None:
+        report['linked_issues'] = {gh_url: keys for gh_url, keys in applyutils.linked_issues.items()
+                                   if keys != initial_linked_issues.get(gh_url)}
+
+    return report
+
+
+def check_journals():
+    """Make sure starting a migration doesn't lose the journal of an earlier one, moving it aside with --fresh"""
+
+    # An earlier journal may record issues created in Jira but not written back to GitHub yet,
+    # which a new migration would create again
+    for repo_config in repos:
+        path = journal_path(repo_config['repo'])
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            continue
+        if not args.fresh:
+            print(f'* Error: Journal {path} from an earlier migration exists. Run again with --resume to finish '
+                  'that migration, or with --fresh to start a new journal.')
+            exit(1)
+        rotated_path = f'{path}.{time.strftime("%Y%m%d%H%M%S")}'
+        os.replace(path, rotated_path)
+        print(f'* Moved the journal of the earlier migration to {rotated_path}')
+
+
+def preload_users():
+    """Resolve the mapped Jira users once into the user cache so worker processes don't look them up again"""
+
+    jira_users = set(user_map.values())
+    jira_users.add(default_user)
+    jira_users.discard('')
+    for _ in pipelineutils.ordered_map(migrationutils.get_jira_user, sorted(jira_users), args.workers):
+        pass
+
+
+if __name__ == '__main__':
+    if not args.dry_run and not args.sync and not args.resume:
+        check_journals()
+
+    if args.replay:
+        print(
+            f'* Replaying {httputils.cassette.count()} recorded responses from {args.replay}')
+
+    if args.refresh_user_cache:
+        migrationutils.user_cache.clear()
+
+    # Fetch the Jira project's create metadata once (or load it from the cache) to validate mappings against
+    if args.refresh_metadata_cache:
+        jirautils.meta_cache.clear()
+    jirautils.get_project_meta()
+
+    # Index Jira issues already linked to GitHub issues so duplicate checks don't need a search per issue
+    if args.prefetch_linked_issues:
+        print('* Indexing Jira issues already linked to GitHub issues')
+        applyutils.linked_issues = jirautils.get_linked_issues()
+    elif args.linked_issues_file:
+        try:
+            linked_issues_file = open(args.linked_issues_file)
+            applyutils.linked_issues = json.load(linked_issues_file)
+            linked_issues_file.close()
+        except:
+            print(
+                f'* Error: Linked issue index {args.linked_issues_file} could not be loaded.')
+            exit(1)
+
+    # Index ZenHub pipelines, estimates, and releases with a few paged queries
+    if args.zenhub_snapshot:
+        print('* Indexing ZenHub workspace pipelines')
+        zenhubutils.load_snapshot()
+
+    reports = []
+    failed_repos = {}
+    if processes == 1:
+        for repo_config in repos:
+            reports.append(migrate_repo(repo_config))
+    else:
+        # Everything the workers share is loaded once here and handed to each of them
+        print(f'* Migrating {len(repos)} repos in {processes} processes')
+        preload_users()
+        shared = {
+            'service_urls': service_urls(),
+            'project_meta': jirautils.project_meta,
+            'zenhub_snapshot': zenhubutils.snapshot,
+            'linked_issues': applyutils.linked_issues
+        }
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(shared,)) as pool:
+            futures = [(repo_config['repo'], pool.submit(run_worker, repo_config))
+                       for repo_config in repos]
+            for repo, future in futures:
+                try:
+                    report = future.result()
+                except (Exception, SystemExit) as e:
+                    # A repo that fails (including exits on unexpected responses) doesn't stop the others
+                    print(f'* Error: Migration of {repo} failed: {e!r}')
+                    failed_repos[repo] = repr(e)
+                    continue
+                metricsutils.merge(report.pop('metrics'))
+                if applyutils.linked_issues is not None:
+                    applyutils.linked_issues.update(
+                        report.pop('linked_issues'))
+                reports.append(report)
+
+    # Report where the time went so the slowest service or endpoint can be spotted
+    metricsutils.print_summary()
+    if args.metrics_file:
+        metricsutils.write_summary(args.metrics_file)
+
+    # Save the linked issue index, which includes any Jira issues created during this run
+    if args.linked_issues_file and applyutils.linked_issues is not None:
+        linked_issues_file = open(args.linked_issues_file, 'w')
+        json.dump(applyutils.linked_issues, linked_issues_file, indent=2)
+        linked_issues_file.close()
+
+    invalid_issues = {}
+    issue_failures = []
+    duplicate_issues = {}
+    unmigrated_issues = []
+    comment_failures = []
+    transition_failures = []
+    write_back_failures = {}
+    for report in reports:
+        invalid_issues.update(report['invalid'])
+        issue_failures.extend(report['failures'])
+        duplicate_issues.update(report['duplicates'])
+        unmigrated_issues.extend(report['unmigrated'])
+        comment_failures.extend(report['comment_failures'])
+        transition_failures.extend(report['transition_failures'])
+        write_back_failures.update(report['write_back_failures'])
+
+    if args.sync:
+        print(f'* Synced {sum(report["synced_fields"] for report in reports)} fields and '
+              f'{sum(report["synced_comments"] for report in reports)} comments to '
+              f'{sum(report["synced_issues"] for report in reports)} Jira issues')
+        if len(unmigrated_issues) > 0:
+            print(f'* Skipped {len(unmigrated_issues)} GitHub issues that haven\'t been migrated yet')
+
+    if len(repos) > 1:
+        print('* Issues returned from GitHub per repo:')
+        for report in reports:
+            print(f'  {report["repo"]}: {report["issue_count"]}')
+
+    if len(invalid_issues) > 0:
+        print('* Invalid Jira mappings that were not sent to Jira:')
+        for issue in invalid_issues:
+            print(f'  {issue}: {"; ".join(invalid_issues[issue])}')
+
+    if len(issue_failures) > 0:
+        if args.sync:
+            print('* Failed to sync Jira issues for:')
         else:
-            # We're not closing, so add squad-level migration label
-            label_response = ghutils.add_issue_label(
-                gh_issue_number, squad_completion_label)
-            if args.verbose:
-                pprint(label_response)
-
-if len(issue_failures) > 0:
-    print('* Failed to create Jira issues for:')
-    for issue in issue_failures:
-        print(f'  {issue}')
-
-if len(duplicate_issues) > 0:
-    print('* Duplicate issues detected for review:')
-    for issue in duplicate_issues:
-        print(f'  {issue}: {duplicate_issues[issue]}')
+            print('* Failed to create Jira issues for:')
+        for issue in issue_failures:
+            print(f'  {issue}')
+
+    if len(comment_failures) > 0:
+        print('* Failed to add every GitHub comment to Jira issues (run again with --resume to retry):')
+        for issue in comment_failures:
+            print(f'  {issue}')
+
+    if len(transition_failures) > 0:
+        print('* Failed to transition Jira issues to their ZenHub status (run again with --resume to retry):')
+        for issue in transition_failures:
+            print(f'  {issue}')
+
+    if len(write_back_failures) > 0:
+        print('* Failed to update GitHub issues after migrating them (run again with --resume to retry):')
+        for issue in write_back_failures:
+            print(f'  {issue}: {", ".join(write_back_failures[issue])}')
+
+    if len(duplicate_issues) > 0:
+        print('* Duplicate issues detected for review:')
+        for issue in duplicate_issues:
+            print(f'  {issue}: {duplicate_issues[issue]}')
+
+    if len(failed_repos) > 0:
+        print('* Failed to migrate repos:')
+        for repo in failed_repos:
+            print(f'  {repo}: {failed_repos[repo]}')
+        exit(1)
@@ -0,0 +1,552 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pprint import pprint
+import utils.attachmentutils as attachmentutils
+import utils.ghutils as ghutils
+import utils.jirautils as jirautils
+import utils.metricsutils as metricsutils
+import utils.migrationutils as migrationutils
+import utils.syncutils as syncutils
+
+# Settings for applying mappings (populated from config.json and CLI arguments)
+dry_run = False
+verbose = False
+component_name = ''
+completion_label = ''
+squad_completion_label = ''
+# Number of issues applied at the same time
+issue_concurrency = 1
+# Number of comments posted at the same time for a single issue (comments may
+# appear out of order in Jira if this is greater than 1)
+comment_concurrency = 1
+# Bytes of GitHub comments to fold into each Jira comment (None adds each GitHub comment as its own Jira comment)
+fold_size = None
+# Whether to copy files pasted into GitHub issues and comments to the Jira issue's attachments
+migrate_attachments = False
+# Dict of GitHub issue URLs to the keys of linked Jira issues (None searches Jira for each issue)
+linked_issues = None
+# Whether to skip creating Jira issues for GitHub issues that are already linked
+skip_duplicates = False
+# Whether to create Jira issues in chunks with the bulk create endpoint
+bulk_create = False
+bulk_size = jirautils.bulk_create_limit
+# Journal of completed stages (a utils.journalutils.Journal) to resume interrupted runs from
+journal = None
+# Number of GitHub issues to write back to in each batched GraphQL request (0 writes back each issue with REST requests)
+write_back_batch_size = 0
+# Number of batches a failed write-back is tried in before it's reported
+write_back_attempts = 3
+# Stages recorded in the journal for each write-back action
+write_back_stages = {
+    'comment': 'commented_back',
+    'label': 'labelled',
+    'close': 'closed'
+}
+write_back_queue = []
+
+executor = None
+reader = None
+
+
+async def call(function, *args):
+    """Run a blocking API call on the apply executor"""
+
+    return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+
+def journal_state(gh_issue_url):
+    """Return the stages already completed for a GitHub issue according to the journal"""
+
+    if journal is None or dry_run:
+        return {'comments': set()}
+
+    return journal.get(gh_issue_url)
+
+
+def record(gh_issue_url, stage, data=None, index=None):
+    """Record a completed stage for a GitHub issue in the journal"""
+
+    if journal is None or dry_run:
+        return
+
+    journal.record(gh_issue_url, stage, data, index)
+
+
+async def add_comment(jira_api_url, comment_map, comment_semaphore, gh_issue_url, indexes):
+    """Add a single Jira comment holding the mapped comments at the indexes to a Jira issue"""
+
+    async with comment_semaphore:
+        comment_response = await call(
+            jirautils.add_comment_from_url, f'{jira_api_url}/comment', comment_map)
+        if verbose:
+            pprint(comment_response)
+        if 'id' in comment_response:
+            for index in indexes:
+                record(gh_issue_url, 'comment', index=index)
+            metricsutils.stage('comment')
+            return True
+
+    return False
+
+
+async def check_duplicates(jira_map, results):
+    """Record Jira issues already linked to the GitHub issue, returning whether to skip it"""
+
+    gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
+    gh_issue_title = jira_map['issue']['summary']
+    print(
+        '* Checking for issues already linked to GitHub issue ' +
+        f'{gh_issue_url} ({gh_issue_title})')
+
+    if linked_issues is not None:
+        duplicate_keys = list(linked_issues.get(gh_issue_url, []))
+    else:
+        search_response = await call(
+            jirautils.search_issues,
+            f'{jirautils.gh_issue_jql_field} = "{gh_issue_url}"',
+            [jirautils.gh_issue_field])
+        if not 'issues' in search_response:
+            # Creating the issue without knowing whether it's linked already could duplicate it
+            print(
+                f'* Error: Jira issues linked to {gh_issue_url} could not be searched: {search_response}')
+            results['failures'].append(gh_issue_url)
+            return True
+        duplicate_keys = list(map(lambda issue: issue['key'], search_response['issues']))
+    if len(duplicate_keys) > 0:
+        results['duplicates'][gh_issue_url] = duplicate_keys
+        if skip_duplicates:
+            print(
+                f'* Skipping GitHub issue already linked to {duplicate_keys}: {gh_issue_url}')
+            return True
+
+    return False
+
+
+async def create_issue(jira_map):
+    """Create a single Jira issue from a mapping and return the creation response"""
+
+    gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
+    gh_issue_title = jira_map['issue']['summary']
+    print(
+        f'* Creating Jira issue for {gh_issue_url} ({gh_issue_title})')
+
+    if dry_run:
+        return {}
+
+    create_response = await call(jirautils.create_issue, jira_map['issue'])
+    if verbose:
+        pprint(create_response)
+
+    return create_response
+
+
+async def create_issues(jira_maps):
+    """Create Jira issues in bulk from mappings and return the creation responses in order"""
+
+    print(f'* Creating {len(jira_maps)} Jira issues in bulk')
+    for jira_map in jira_maps:
+        gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
+        gh_issue_title = jira_map['issue']['summary']
+        print(
+            f'* Creating Jira issue for {gh_issue_url} ({gh_issue_title})')
+
+    if dry_run:
+        return [{} for _ in jira_maps]
+
+    create_responses = await call(
+        jirautils.create_issues, [jira_map['issue'] for jira_map in jira_maps])
+    if verbose:
+        pprint(create_responses)
+
+    # Retry only the issues that failed, one at a time
+    for index, jira_map in enumerate(jira_maps):
+        if not 'key' in create_responses[index]:
+            gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
+            print(
+                f'* Bulk creation failed for {gh_issue_url}, retrying individually: ' +
+                f'{create_responses[index].get("errors")}')
+            create_responses[index] = await create_issue(jira_map)
+
+    return create_responses
+
+
+async def apply_mapping(jira_map, results):
+    """Create a Jira issue with comments and status from a mapping and update the GitHub issue"""
+
+    # Pick up where an interrupted run left off if the issue was already created
+    state = journal_state(jira_map['issue'][jirautils.gh_issue_field])
+    if 'created' in state:
+        await apply_created(jira_map, state['created'], results)
+        return
+
+    if await check_duplicates(jira_map, results):
+        return
+
+    create_response = await create_issue(jira_map)
+    await apply_created(jira_map, create_response, results)
+
+
+async def flush_write_backs(results):
+    """Write back the next batch of queued GitHub issues in one request, requeueing the actions that failed"""
+
+    batch = write_back_queue[:write_back_batch_size]
+    del write_back_queue[:write_back_batch_size]
+    if len(batch) == 0:
+        return
+
+    print(f'* Writing back to {len(batch)} GitHub issues in one request')
+    write_back_results = await call(ghutils.write_back_issues, batch)
+    if verbose:
+        pprint(write_back_results)
+
+    for write_back, write_back_result in zip(batch, write_back_results):
+        gh_issue_url = write_back['gh_issue_url']
+        for action in write_back['actions']:
+            if write_back_result[action]:
+                record(gh_issue_url, write_back_stages[action])
+
+        failed_actions = [action for action in write_back['actions']
+                          if not write_back_result[action]]
+        if len(failed_actions) == 0:
+            metricsutils.stage('write_back')
+            continue
+
+        write_back['actions'] = failed_actions
+        write_back['attempts'] += 1
+        if write_back['attempts'] < write_back_attempts:
+            print(
+                f'* Requeueing failed GitHub write-back ({", ".join(failed_actions)}) for {gh_issue_url}')
+            write_back_queue.append(write_back)
+        else:
+            print(
+                f'* Error: GitHub write-back ({", ".join(failed_actions)}) failed for {gh_issue_url}')
+            results['write_back_failures'][gh_issue_url] = failed_actions
+
+
+async def queue_write_back(jira_map, gh_comment, state, results):
+    """Queue the comment, label, and closing of a GitHub issue to be written back in a batch"""
+
+    gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
+    gh_issue_number = jira_map['gh_issue_number']
+    write_back = {
+        'gh_issue_url': gh_issue_url,
+        'node_id': jira_map['gh_node_id'],
+        'actions': [],
+        'attempts': 0
+    }
+
+    if not 'commented_back' in state:
+        write_back['actions'].append('comment')
+        write_back['comment'] = gh_comment
+
+    if not 'labelled' in state:
+        label = completion_label if jira_map['close_gh_issue'] else squad_completion_label
+        label_id = await call(ghutils.get_label_id, label)
+        if label_id is None:
+            # Only the REST API creates labels that don't exist yet, so the first issue with a new label uses it
+            label_response = await call(
+                ghutils.add_issue_label, gh_issue_number, label)
+            if verbose:
+                pprint(label_response)
+            if isinstance(label_response, list):
+                record(gh_issue_url, 'labelled')
+        else:
+            write_back['actions'].append('label')
+            write_back['label'] = label_id
+
+    if jira_map['close_gh_issue'] and not 'closed' in state:
+        write_back['actions'].append('close')
+
+    if len(write_back['actions']) == 0:
+        metricsutils.stage('write_back')
+        return
+
+    write_back_queue.append(write_back)
+    if len(write_back_queue) >= write_back_batch_size:
+        await flush_write_backs(results)
+
+
+async def apply_attachments(jira_map, jira_key, state):
+    """Copy the GitHub files in a mapping to the Jira issue and return the mapping with their URLs replaced"""
+
+    gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
+
+    # The description was already updated if an interrupted run got this far
+    if 'attachments' in state:
+        return attachmentutils.rewrite_mapping(jira_map, state['attachments'])
+
+    urls = attachmentutils.mapping_urls(jira_map)
+    if len(urls) == 0:
+        record(gh_issue_url, 'attachments', {})
+        return jira_map
+
+    print(
+        f'* Copying {len(urls)} attachments from GitHub to Jira issue {jira_key} ({gh_issue_url})')
+    url_map = await call(attachmentutils.migrate_attachments, jira_key, urls)
+    rewritten_map = attachmentutils.rewrite_mapping(jira_map, url_map)
+
+    description = rewritten_map['issue']['description']
+    if description != jira_map['issue']['description']:
+        update_response = await call(
+            jirautils.update_issue, jira_key, {'description': description})
+        if verbose:
+            pprint(update_response)
+        if not update_response.ok:
+            print(
+                f'* Error: Failed to update the attachment links of {jira_key} ({gh_issue_url}): {update_response} {update_response.reason}')
+            return rewritten_map
+
+    record(gh_issue_url, 'attachments', url_map)
+
+    return rewritten_map
+
+
+async def apply_created(jira_map, create_response, results):
+    """Add comments and status to a created Jira issue and update the GitHub issue"""
+
+    gh_issue_url = jira_map['issue'][jirautils.gh_issue_field]
+
+    state = journal_state(gh_issue_url)
+
+    jira_api_url = ''
+    jira_key = ''
+    if 'self' in create_response:
+        jira_api_url = create_response['self']
+    if 'key' in create_response:
+        jira_key = create_response['key']
+        if 'created' in state:
+            print(
+                f'* Resuming migration of {gh_issue_url} to Jira issue {jira_key}')
+        else:
+            record(gh_issue_url, 'created', {
+                'key': jira_key,
+                'self': jira_api_url
+            })
+            metricsutils.stage('create')
+            if linked_issues is not None:
+                linked_issues.setdefault(gh_issue_url, []).append(jira_key)
+
+    if not dry_run and jira_key == '':
+        print(
+            f'* Error: A Jira key was not returned in the creation response for {gh_issue_url}')
+        results['failures'].append(gh_issue_url)
+        return
+
+    if migrate_attachments and not dry_run:
+        jira_map = await apply_attachments(jira_map, jira_key, state)
+
+    print(
+        f'* Adding comments from GitHub to new Jira issue {jira_key} ({gh_issue_url})')
+
+    posted_comments = set(state['comments'])
+    if not dry_run:
+        comment_semaphore = asyncio.Semaphore(comment_concurrency)
+        remaining_comments = [index for index in range(len(jira_map['comments']))
+                              if not index in state['comments']]
+        groups = migrationutils.comment_groups(
+            jira_map['comments'], remaining_comments, fold_size)
+        added = await asyncio.gather(*[
+            add_comment(jira_api_url, comment_map,
+                        comment_semaphore, gh_issue_url, indexes)
+            for indexes, comment_map in groups])
+        for (indexes, _), is_added in zip(groups, added):
+            if is_added:
+                posted_comments.update(indexes)
+        if not all(added):
+            # Left unrecorded so --resume adds the missing comments
+            print(
+                f'* Error: Failed to add {added.count(False)} comments to {jira_key} ({gh_issue_url})')
+            results['comment_failures'].append(gh_issue_url)
+
+    print(
+        f'* Adjusting status of Jira issue to match ZenHub pipeline {jira_key} ({gh_issue_url})')
+    is_transitioned = 'transitioned' in state
+    if not dry_run and not is_transitioned:
+        if jira_map['issue']['status']:
+            is_transitioned, transition_response = await call(
+                jirautils.do_transition, jira_key, jira_map['issue']['status'],
+                jira_map['issue']['issuetype']['name'])
+            if verbose:
+                pprint(transition_response)
+            if is_transitioned:
+                record(gh_issue_url, 'transitioned')
+                metricsutils.stage('transition')
+            else:
+                # Left unrecorded so --resume (or the next --sync) tries the transition again
+                results['transition_failures'].append(gh_issue_url)
+        else:
+            is_transitioned = True
+            record(gh_issue_url, 'transitioned')
+
+    # Add comment in GH issue with link to new Jira issue
+    gh_issue_number = jira_map['gh_issue_number']
+    jira_html_url = f'{jirautils.html_url}/{jira_key}'
+    gh_comment = 'This issue has been migrated to Jira'
+    if component_name != '':
+        gh_comment += f' for {component_name}'
+    gh_comment += f': {jira_html_url}'
+
+    # Mappings journaled by older runs don't have the node ID needed for batched write-backs
+    is_batched = write_back_batch_size > 0 and 'gh_node_id' in jira_map
+
+    if not dry_run and not is_batched and not 'commented_back' in state:
+        comment_response = await call(
+            ghutils.add_issue_comment, gh_issue_number, gh_comment)
+        if verbose:
+            pprint(comment_response)
+        if 'id' in comment_response:
+            record(gh_issue_url, 'commented_back')
+        else:
+            results['write_back_failures'].setdefault(
+                gh_issue_url, []).append('comment')
+
+    # Add migration label and close GH issue if allowed
+    print(
+        f'* Handling GitHub issue labels and closing issue if allowed ({gh_issue_url})')
+    if not dry_run and is_batched:
+        await queue_write_back(jira_map, gh_comment, state, results)
+    elif not dry_run:
+        if jira_map['close_gh_issue']:
+            if not 'labelled' in state:
+                label_response = await call(
+                    ghutils.add_issue_label, gh_issue_number, completion_label)
+                if verbose:
+                    pprint(label_response)
+                if isinstance(label_response, list):
+                    record(gh_issue_url, 'labelled')
+                else:
+                    results['write_back_failures'].setdefault(
+                        gh_issue_url, []).append('label')
+            if not 'closed' in state:
+                close_response = await call(ghutils.close_issue, gh_issue_number)
+                if verbose:
+                    pprint(close_response)
+                if close_response.get('state') == 'closed':
+                    record(gh_issue_url, 'closed')
+                else:
+                    results['write_back_failures'].setdefault(
+                        gh_issue_url, []).append('close')
+        elif not 'labelled' in state:
+            # We're not closing, so add squad-level migration label
+            label_response = await call(
+                ghutils.add_issue_label, gh_issue_number, squad_completion_label)
+            if verbose:
+                pprint(label_response)
+            if isinstance(label_response, list):
+                record(gh_issue_url, 'labelled')
+            else:
+                results['write_back_failures'].setdefault(
+                    gh_issue_url, []).append('label')
+        metricsutils.stage('write_back')
+
+    if not dry_run:
+        # Record what was migrated as the baseline for later syncs (mappings journaled by
+        # older runs don't have comment IDs, so their comments become the baseline instead)
+        comment_ids = jira_map.get('comment_ids')
+        if comment_ids is not None:
+            comment_ids = [comment_ids[index]
+                           for index in sorted(posted_comments)]
+        await call(syncutils.seed, gh_issue_url, jira_key, jira_map['issue'], comment_ids, is_transitioned)
+
+
+async def next_mapping(jira_mappings):
+    """Return the next mapping from the upstream stage (or None when done) without blocking the event loop"""
+
+    return await asyncio.get_running_loop().run_in_executor(
+        reader, next, jira_mappings, None)
+
+
+async def apply_mappings(jira_mappings):
+    """Apply mappings concurrently as they arrive, keeping the order of steps within each issue"""
+
+    results = {
+        'failures': [],
+        'duplicates': {},
+        'comment_failures': [],
+        'transition_failures': [],
+        'write_back_failures': {}
+    }
+    write_back_queue.clear()
+    issue_semaphore = asyncio.Semaphore(issue_concurrency)
+    tasks = set()
+
+    def finished(task):
+        issue_semaphore.release()
+        metricsutils.stage('finished')
+        # Keep failed tasks so their errors are raised below
+        if task.cancelled() or task.exception() is None:
+            tasks.discard(task)
+
+    async def spawn(coroutine_function, *args):
+        # Only pull more work from upstream once there's capacity for it
+        await issue_semaphore.acquire()
+        task = asyncio.create_task(coroutine_function(*args))
+        tasks.add(task)
+        task.add_done_callback(finished)
+
+    jira_mappings = iter(jira_mappings)
+    while True:
+        if not bulk_create:
+            await issue_semaphore.acquire()
+            jira_map = await next_mapping(jira_mappings)
+            issue_semaphore.release()
+            if jira_map is None:
+                break
+            await spawn(apply_mapping, jira_map, results)
+            continue
+
+        # Create each chunk in bulk, then finish the created issues while the next chunk is created
+        chunk = []
+        while len(chunk) < bulk_size:
+            jira_map = await next_mapping(jira_mappings)
+            if jira_map is None:
+                break
+            chunk.append(jira_map)
+        if len(chunk) == 0:
+            break
+
+        # Issues created by an interrupted run skip straight to the remaining stages
+        remaining = []
+        for jira_map in chunk:
+            state = journal_state(jira_map['issue'][jirautils.gh_issue_field])
+            if 'created' in state:
+                await spawn(apply_created, jira_map, state['created'], results)
+            else:
+                remaining.append(jira_map)
+        chunk = remaining
+
+        skipped = await asyncio.gather(*[
+            check_duplicates(jira_map, results) for jira_map in chunk])
+        chunk = [jira_map for jira_map, skip in zip(chunk, skipped) if not skip]
+        metricsutils.stage('finished', skipped.count(True))
+        if len(chunk) == 0:
+            continue
+
+        create_responses = await create_issues(chunk)
+        for jira_map, create_response in zip(chunk, create_responses):
+            await spawn(apply_created, jira_map, create_response, results)
+
+    await asyncio.gather(*tasks)
+
+    # Write back the last partial batch, along with any actions that failed and were requeued
+    while len(write_back_queue) > 0:
+        await flush_write_backs(results)
+
+    return results
+
+
+def apply_all(jira_mappings):
+    """Apply mappings from an iterable and return a dict of failed and duplicate GitHub issue URLs"""
+    assert issue_concurrency > 0    # concurrency needs to be set properly
+    assert comment_concurrency > 0  # concurrency needs to be set properly
+    assert 0 < bulk_size <= jirautils.bulk_create_limit  # bulk size needs to be set properly
+
+    global executor, reader
+    executor = ThreadPoolExecutor(
+        max_workers=issue_concurrency * comment_concurrency)
+    reader = ThreadPoolExecutor(max_workers=1)
+    try:
+        return asyncio.run(apply_mappings(jira_mappings))
+    finally:
+        executor.shutdown()
+        reader.shutdown()
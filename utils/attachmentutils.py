@@ -0,0 +1,231 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import mimetypes
+import migrationauth
+import re
+import tempfile
+import threading
+from urllib.parse import unquote, urlparse
+import utils.httputils as httputils
+import utils.jirautils as jirautils
+
+# GitHub URLs of files pasted into issues and comments (user-images for older uploads, user-attachments for newer)
+url_pattern = re.compile(
+    r'https://(?:(?:private-)?user-images\.githubusercontent\.com|github\.com/user-attachments)/[^\s()<>"\'\[\]]+')
+# Punctuation that ends a sentence rather than a URL
+trailing_punctuation = '.,;:!?'
+# Number of files downloaded and uploaded at the same time
+concurrency = 4
+# Size of the chunks files are downloaded in
+chunk_size = 64 * 1024
+# Bytes of a download kept in memory before it's spooled to a temporary file
+spool_size = 1024 * 1024
+# Caches (utils.cacheutils.Cache) of the Jira content URL of each migrated GitHub URL and file hash
+url_cache = None
+hash_cache = None
+# Migrations in progress by GitHub URL and by file hash, so concurrent callers wait on them rather than repeating them
+url_requests = {}
+hash_requests = {}
+requests_lock = threading.Lock()
+
+executor = None
+executor_lock = threading.Lock()
+
+# Service of the session that pasted files are downloaded with
+files_service = 'github_files'
+
+# Uploaded files may be private, so they're downloaded with the GitHub credentials (which aren't sent on
+# to the storage hosts GitHub redirects to)
+httputils.register_session(
+    files_service,
+    auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN)
+)
+
+
+def find_urls(bodies):
+    """Return the GitHub file URLs in issue or comment bodies in the order they first appear"""
+
+    urls = {}
+    for body in bodies:
+        for match in url_pattern.finditer(body or ''):
+            urls[match.group(0).rstrip(trailing_punctuation)] = True
+
+    return list(urls)
+
+
+def mapping_urls(mapping_obj):
+    """Return the GitHub file URLs in the description and comments of a mapping"""
+
+    return find_urls([mapping_obj['issue']['description']] +
+                     [comment['body'] for comment in mapping_obj['comments']])
+
+
+def rewrite(body, url_map):
+    """Return a body with the GitHub file URLs replaced by their Jira content URLs"""
+
+    def replace(match):
+        url = match.group(0).rstrip(trailing_punctuation)
+        return url_map.get(url, url) + match.group(0)[len(url):]
+
+    return url_pattern.sub(replace, body or '')
+
+
+def rewrite_mapping(mapping_obj, url_map):
+    """Return a copy of a mapping with the GitHub file URLs in its description and comments replaced"""
+
+    if len(url_map) == 0:
+        return mapping_obj
+
+    issue = dict(mapping_obj['issue'],
+                 description=rewrite(mapping_obj['issue']['description'], url_map))
+    comments = [dict(comment, body=rewrite(comment['body'], url_map))
+                for comment in mapping_obj['comments']]
+
+    return dict(mapping_obj, issue=issue, comments=comments)
+
+
+def deduplicated(requests, key, cache, function):
+    """Return the cached value for a key, or run the function once for all concurrent callers and cache its result"""
+
+    with requests_lock:
+        request = requests.get(key)
+        is_owner = request is None
+        if is_owner:
+            if cache:
+                cached_value = cache.get(key)
+                if cached_value is not None:
+                    return cached_value
+            request = Future()
+            requests[key] = request
+
+    if not is_owner:
+        return request.result()
+
+    try:
+        value = function()
+        # Failures aren't cached so they're tried again later
+        if cache and value is not None:
+            cache.set(key, value)
+        request.set_result(value)
+    except BaseException as e:
+        request.set_exception(e)
+        raise
+    finally:
+        with requests_lock:
+            del requests[key]
+
+    return value
+
+
+def file_name(url, response):
+    """Return the name of a downloaded file from its Content-Disposition or URL, with an extension for its type"""
+
+    name = None
+    disposition = response.headers.get('Content-Disposition', '')
+    match = re.search(r'filename="?([^";]+)"?', disposition)
+    if match:
+        name = match.group(1)
+    else:
+        name = unquote(urlparse(url).path.rstrip('/').split('/')[-1])
+
+    if not '.' in name:
+        content_type = response.headers.get('Content-Type', '').split(';')[0]
+        name += mimetypes.guess_extension(content_type) or ''
+
+    return name
+
+
+def download(url):
+    """Stream a GitHub file into a temporary file while hashing it, returning the file and its details (None if it failed)"""
+
+    response = httputils.request(
+        files_service, 'GET', url,
+        stream=True
+    )
+    if not response.ok:
+        print(
+            f'* Warning: Attachment could not be downloaded from {url}: {response} {response.reason}')
+        response.close()
+        return None
+
+    # Small files stay in memory and larger ones are spooled to disk, so no file is held in memory whole
+    file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        for chunk in response.iter_content(chunk_size):
+            file.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    except BaseException:
+        file.close()
+        raise
+    finally:
+        response.close()
+
+    return {
+        'file': file,
+        'size': size,
+        'hash': digest.hexdigest(),
+        'name': file_name(url, response),
+        'content_type': response.headers.get('Content-Type', 'application/octet-stream').split(';')[0]
+    }
+
+
+def upload(jira_key, downloaded):
+    """Stream a downloaded file to a Jira issue's attachments and return its content URL (None if it failed)"""
+
+    upload_response = jirautils.add_attachment(
+        jira_key, downloaded['name'], downloaded['content_type'], downloaded['file'], downloaded['size'])
+    if not upload_response.ok:
+        print(
+            f'* Warning: Attachment {downloaded["name"]} could not be uploaded to {jira_key}: {upload_response} {upload_response.reason}')
+        return None
+
+    return upload_response.json()[0]['content']
+
+
+def migrate_attachment(jira_key, url):
+    """Copy a GitHub file to a Jira issue and return its Jira content URL (None if it failed)"""
+
+    def migrate_url():
+        downloaded = download(url)
+        if downloaded is None:
+            return None
+
+        # Files with the same content (such as a screenshot pasted twice) are uploaded once and shared between issues
+        try:
+            return deduplicated(hash_requests, downloaded['hash'], hash_cache,
+                                lambda: upload(jira_key, downloaded))
+        finally:
+            downloaded['file'].close()
+
+    return deduplicated(url_requests, url, url_cache, migrate_url)
+
+
+def migrate_attachments(jira_key, urls):
+    """Copy GitHub files to a Jira issue on the attachment pool and return a dict of their Jira content URLs"""
+    assert concurrency > 0  # concurrency needs to be set properly
+
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    content_urls = executor.map(
+        lambda url: migrate_attachment(jira_key, url), urls)
+
+    return {url: content_url for url, content_url in zip(urls, content_urls)
+            if content_url is not None}
+
+
+def known_attachments(urls):
+    """Return a dict of the Jira content URLs of GitHub files that were already migrated"""
+
+    if url_cache is None:
+        return {}
+
+    content_urls = {url: url_cache.get(url) for url in urls}
+
+    return {url: content_url for url, content_url in content_urls.items()
+            if content_url is not None}
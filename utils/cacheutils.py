@@ -0,0 +1,171 @@
+import json
+import sqlite3
+import threading
+import time
+
+# Fraction of the size limits a cache is evicted down to once it goes over them, so eviction
+# happens in batches rather than on every insert
+eviction_target = 0.9
+# Number of cache hits whose access times are written together
+access_batch_size = 100
+
+
+class Cache:
+    """Persistent key/value store backed by SQLite with per-entry TTL and size-bounded eviction"""
+
+    def __init__(self, path, name, ttl=None, max_entries=None, max_bytes=None):
+        assert name.isidentifier()  # name is used as the table name
+
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+        # Access times of cache hits not written yet
+        self.accessed = {}
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} ('
+                'key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)')
+            self.connection.execute(
+                f'CREATE INDEX IF NOT EXISTS {name}_accessed ON {name} (accessed)')
+            self.count_entries()
+
+    def count_entries(self):
+        """Recount the entries and bytes stored (the running totals can drift when processes share the file)"""
+
+        self.entries, self.bytes = self.connection.execute(
+            f'SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM {self.name}').fetchone()
+
+    def remove(self, key):
+        """Delete an entry and take it off the running totals"""
+
+        row = self.connection.execute(
+            f'SELECT LENGTH(value) FROM {self.name} WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return
+        self.connection.execute(
+            f'DELETE FROM {self.name} WHERE key = ?', (key,))
+        self.entries -= 1
+        self.bytes -= row[0]
+        self.accessed.pop(key, None)
+
+    def write_accessed(self):
+        """Write the access times of the cache hits since the last write"""
+
+        if len(self.accessed) == 0:
+            return
+
+        self.connection.executemany(
+            f'UPDATE {self.name} SET accessed = ? WHERE key = ?',
+            [(accessed, key) for key, accessed in self.accessed.items()])
+        self.accessed = {}
+
+    def is_over_limits(self):
+        """Whether the running totals are over the size limits"""
+
+        return ((self.max_entries and self.entries > self.max_entries) or
+                (self.max_bytes and self.bytes > self.max_bytes))
+
+    def evict(self):
+        """Delete the least recently used entries until the cache is back under its eviction target"""
+
+        self.write_accessed()
+        self.count_entries()
+        if not self.is_over_limits():
+            return
+
+        target_entries = self.entries
+        if self.max_entries:
+            target_entries = min(target_entries, int(
+                self.max_entries * eviction_target))
+        target_bytes = self.bytes
+        if self.max_bytes:
+            target_bytes = min(target_bytes, int(
+                self.max_bytes * eviction_target))
+
+        evicted_keys = []
+        entries = self.entries
+        total_bytes = self.bytes
+        for key, size in self.connection.execute(
+                f'SELECT key, LENGTH(value) FROM {self.name} ORDER BY accessed'):
+            if entries <= target_entries and total_bytes <= target_bytes:
+                break
+            evicted_keys.append((key,))
+            entries -= 1
+            total_bytes -= size
+
+        self.connection.executemany(
+            f'DELETE FROM {self.name} WHERE key = ?', evicted_keys)
+        self.entries = entries
+        self.bytes = total_bytes
+
+    def get(self, key, default=None):
+        """Return the cached value for a key or the default if missing or expired"""
+
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                f'SELECT value, expires FROM {self.name} WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return default
+            if row[1] is not None and row[1] < now:
+                with self.connection:
+                    self.remove(key)
+                return default
+            # Access times only decide what's evicted first, so they're written in batches
+            self.accessed[key] = now
+            if len(self.accessed) >= access_batch_size:
+                with self.connection:
+                    self.write_accessed()
+
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON-serializable value, evicting the least recently used entries if over the size limits"""
+
+        if ttl is None:
+            ttl = self.ttl
+
+        now = time.time()
+        expires = None
+        if ttl is not None:
+            expires = now + ttl
+
+        serialized_value = json.dumps(value)
+        with self.lock, self.connection:
+            self.remove(key)
+            self.connection.execute(
+                f'INSERT INTO {self.name} VALUES (?, ?, ?, ?)',
+                (key, serialized_value, expires, now))
+            self.entries += 1
+            self.bytes += len(serialized_value)
+            if self.is_over_limits():
+                self.evict()
+
+    def delete(self, key):
+        """Remove a single entry"""
+
+        with self.lock, self.connection:
+            self.remove(key)
+
+    def clear(self):
+        """Remove all entries"""
+
+        with self.lock, self.connection:
+            self.connection.execute(f'DELETE FROM {self.name}')
+            self.entries = 0
+            self.bytes = 0
+            self.accessed = {}
+
+    def close(self):
+        """Write any pending access times and close the underlying database connection"""
+
+        with self.lock:
+            with self.connection:
+                self.write_accessed()
+            self.connection.close()
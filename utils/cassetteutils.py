@@ -0,0 +1,80 @@
+import hashlib
+import json
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import sqlite3
+import threading
+import zlib
+
+
+def request_key(service, method, url, params=None, json_body=None, data=None):
+    """Return the key of a request, from everything that decides its response except the headers"""
+
+    prepared_url = requests.Request(method, url, params=params).prepare().url
+    body = ''
+    if json_body is not None:
+        body = json.dumps(json_body, sort_keys=True)
+    elif isinstance(data, (str, bytes)):
+        body = data if isinstance(data, str) else data.decode('utf-8', 'replace')
+
+    return hashlib.sha256(f'{service}\n{method}\n{prepared_url}\n{body}'.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """SQLite file of compressed HTTP responses indexed by request, recorded from one run and replayed in another"""
+
+    def __init__(self, path, replaying=False):
+        self.path = path
+        self.replaying = replaying
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, status INTEGER, reason TEXT, headers TEXT, url TEXT, body BLOB)')
+
+    def record(self, key, response):
+        """Store a response for a request key (replacing the one recorded before)"""
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, response.status_code, response.reason, json.dumps(dict(response.headers)),
+                 response.url, zlib.compress(response.content)))
+
+    def replay(self, key):
+        """Return the response recorded for a request key (None if it wasn't recorded)"""
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT status, reason, headers, url, body FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        response = requests.Response()
+        response.status_code = row[0]
+        response.reason = row[1]
+        response.headers = CaseInsensitiveDict(json.loads(row[2]))
+        # Recorded bodies are already decoded, so they mustn't be decoded again
+        response.headers.pop('Content-Encoding', None)
+        response.encoding = get_encoding_from_headers(response.headers) or 'utf-8'
+        response.url = row[3]
+        response._content = zlib.decompress(row[4])
+        response.from_cassette = True
+
+        return response
+
+    def count(self):
+        """Return the number of recorded responses"""
+
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        """Close the underlying database connection"""
+
+        with self.lock:
+            self.connection.close()
@@ -1,27 +1,161 @@
+import calendar
 import migrationauth
-import requests
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import utils.httputils as httputils
+import utils.metricsutils as metricsutils
 
 org_repo = 'stolostron/backlog'
-root_url = 'https://api.github.com/repos'
+api_url = 'https://api.github.com'
+root_url = f'{api_url}/repos'
 base_url = f'{root_url}/{org_repo}/issues'
+graphql_url = f'{api_url}/graphql'
+search_url = f'{api_url}/search/issues'
+# The search API only returns this many results for a query, so larger result sets are split by creation date
+search_result_limit = 1000
+# Database ID of the repo when returned by a GraphQL fetch (saves fetching the repo separately)
+repo_database_id = None
+# Node IDs of labels by repo and name for adding labels with GraphQL
+label_ids = {}
+label_ids_lock = threading.Lock()
+# Most issues to write back to in one GraphQL request (each issue takes up to three mutations)
+write_back_batch_limit = 50
+
+issues_query = """query ($owner: String!, $name: String!, $labels: [String!], $pagination: Int!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    databaseId
+    issues(labels: $labels, states: OPEN, first: $pagination, after: $after,
+           orderBy: {field: CREATED_AT, direction: DESC}) {
+      totalCount
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        id
+        databaseId
+        number
+        title
+        body
+        url
+        author {
+          __typename
+          login
+        }
+        labels(first: 100) {
+          nodes {
+            name
+          }
+        }
+        assignees(first: 100) {
+          nodes {
+            login
+          }
+        }
+        comments(first: 100) {
+          pageInfo {
+            hasNextPage
+            endCursor
+          }
+          nodes {
+            databaseId
+            author {
+              __typename
+              login
+            }
+            body
+            createdAt
+          }
+        }
+      }
+    }
+  }
+}"""
+
+comments_query = """query ($id: ID!, $after: String) {
+  node(id: $id) {
+    ... on Issue {
+      comments(first: 100, after: $after) {
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        nodes {
+          databaseId
+          author {
+            __typename
+            login
+          }
+          body
+          createdAt
+        }
+      }
+    }
+  }
+}"""
+
+label_query = """query ($owner: String!, $name: String!, $label: String!) {
+  repository(owner: $owner, name: $name) {
+    label(name: $label) {
+      id
+    }
+  }
+}"""
+
+# Alias prefix, mutation, input, and variable of each action in the batched write-back mutation
+write_back_fields = {
+    'comment': ('c', 'addComment', 'subjectId: $id{index}, body: $comment{index}', 'comment{index}: String!'),
+    'label': ('l', 'addLabelsToLabelable', 'labelableId: $id{index}, labelIds: [$label{index}]', 'label{index}: ID!'),
+    'close': ('x', 'closeIssue', 'issueId: $id{index}', None)
+}
+
+httputils.register_session(
+    'github',
+    auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+    headers={'Accept': 'application/vnd.github+json'}
+)
+# The search API has its own, much lower rate limit, so it's paced separately
+httputils.register_session(
+    'github_search',
+    auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+    headers={'Accept': 'application/vnd.github+json'}
+)
+
+
+def set_repo(repo):
+    """Point the GitHub functions at a different org/repo"""
+
+    global org_repo, base_url, repo_database_id
+    org_repo = repo
+    base_url = f'{root_url}/{org_repo}/issues'
+    repo_database_id = None
 
 
 def get_repo():
     """Get repo object for current repo specified in org_repo"""
 
     url = f'{root_url}/{org_repo}'
-    return requests.get(
-        url,
-        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN)
+    return httputils.request(
+        'github', 'GET', url
     ).json()
 
 
-def get_issues_by_label(labels, label_exclusions, pagination=100):
+def get_issues_by_label(labels, pagination=100):
     """Get list of issues by label"""
+
+    issues = []
+    for page in iter_issues_by_label(labels, pagination):
+        issues.extend(page)
+
+    return issues
+
+
+def iter_issues_by_label(labels, pagination=100, since=None, state='open'):
+    """Yield pages of issues by label as they are fetched (optionally only those updated since an ISO 8601 time)"""
     assert 0 < pagination <= 100  # pagination size needs to be set properly
     assert labels                 # Labels cannot be None
 
-    issues = []
     page = 0
     url = f'{base_url}'
 
@@ -30,11 +164,13 @@ def get_issues_by_label(labels, label_exclusions, pagination=100):
         data = {
             'per_page': pagination,
             'labels': labels,
+            'state': state,
             'page': page
         }
-        response = requests.get(
-            url,
-            auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+        if since:
+            data['since'] = since
+        response = httputils.request(
+            'github', 'GET', url,
             params=data
         )
 
@@ -44,36 +180,245 @@ def get_issues_by_label(labels, label_exclusions, pagination=100):
             print(response.json())
             exit(1)
 
-        # Get all the issues excluding the PRs and specified labels
-        issues.extend([issue for issue in response.json()
-                       if not has_label(issue, label_exclusions) and not issue.get("pull_request")])
+        # Estimate the number of issues from the last page number for the progress ETA
+        if page == 1 and 'last' in response.links:
+            last_page = parse_qs(urlparse(response.links['last']['url']).query).get('page')
+            if last_page:
+                metricsutils.expected_issues = int(last_page[0]) * pagination
+        elif page == 1:
+            metricsutils.expected_issues = len(response.json())
+
+        # Get all the issues excluding the PRs (excluded labels are left to the label rules)
+        yield [issue for issue in response.json() if not issue.get("pull_request")]
 
         if not 'next' in response.links.keys():
             break
 
-    return issues
 
+def search_query(labels, label_exclusions, state='open', since=None, created_since=None):
+    """Return a search API query for issues of the current repo with all the labels and none of the exclusions"""
 
-def has_label(issue, label_query):
-    """Whether an issue has a given label"""
+    qualifiers = [f'repo:{org_repo}', 'is:issue']
+    if state != 'all':
+        qualifiers.append(f'is:{state}')
+    qualifiers.extend(f'label:"{label}"' for label in labels.split(',') if label)
+    qualifiers.extend(f'-label:"{label}"' for label in label_exclusions.split(',') if label)
+    if since:
+        qualifiers.append(f'updated:>={since}')
+    if created_since:
+        qualifiers.append(f'created:>={created_since}')
 
-    label_list = label_query.split(',')
+    return ' '.join(qualifiers)
 
-    for label_obj in issue['labels']:
-        for label_name in label_list:
-            if str(label_obj['name']) == label_name:
-                return True
 
-    return False
+def search_issues(query, page, pagination):
+    """Get a page of issues from the search API, oldest first"""
+
+    response = httputils.request(
+        'github_search', 'GET', search_url,
+        params={
+            'q': query,
+            'sort': 'created',
+            'order': 'asc',
+            'per_page': pagination,
+            'page': page
+        }
+    )
+
+    if not response.ok:
+        print(
+            f'* An unexpected response was returned from GitHub: {response} {response.reason}')
+        print(response.json())
+        exit(1)
+
+    return response.json()
+
+
+def iter_issues_by_search(labels, label_exclusions, pagination=100, since=None, state='open'):
+    """Yield pages of issues by label from the search API, which leaves out excluded labels and PRs on GitHub's side"""
+    assert 0 < pagination <= 100  # pagination size needs to be set properly
+    assert labels                 # Labels cannot be None
+
+    # The search API only returns the first results of a query, so each window of creation
+    # times starts where the last one ended, skipping the issues already seen at that time
+    created_since = None
+    boundary_ids = set()
+    while True:
+        query = search_query(labels, label_exclusions,
+                             state, since, created_since)
+        page = 1
+        result = search_issues(query, page, pagination)
+        if created_since is None:
+            metricsutils.expected_issues = result['total_count']
+
+        fetched = 0
+        last_created = None
+        last_ids = set()
+        while True:
+            issues = result['items']
+            fetched += len(issues)
+            for issue in issues:
+                if issue['created_at'] != last_created:
+                    last_created = issue['created_at']
+                    last_ids = set()
+                last_ids.add(issue['id'])
+
+            # The search index can lag behind label changes, so exclusions are still checked by the label rules
+            yield [issue for issue in issues if not issue['id'] in boundary_ids]
+
+            if len(issues) < pagination or fetched >= min(result['total_count'], search_result_limit):
+                break
+            page += 1
+            result = search_issues(query, page, pagination)
+
+        if result['total_count'] <= search_result_limit or last_created is None:
+            break
+
+        if last_created == created_since:
+            # A whole window was created in the same second, so move past it
+            print(
+                f'* Warning: Only {search_result_limit} issues created at {last_created} can be searched')
+            last_created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(
+                calendar.timegm(time.strptime(last_created, '%Y-%m-%dT%H:%M:%SZ')) + 1))
+            last_ids = set()
+        created_since = last_created
+        boundary_ids = last_ids
+
+
+def graphql(query, variables):
+    """Run a GraphQL query with variables and return its data"""
+
+    response = httputils.request(
+        'github', 'POST', graphql_url, is_write=False,
+        json={'query': query, 'variables': variables}
+    )
+
+    if not response.ok:
+        print(
+            f'* An unexpected response was returned from GitHub: {response} {response.reason}')
+        print(response.json())
+        exit(1)
+
+    response_json = response.json()
+    if response_json.get('errors'):
+        print(
+            f'* An unexpected response was returned from GitHub: {response_json["errors"]}')
+        exit(1)
+
+    return response_json['data']
+
+
+def login(actor):
+    """Return the login of a GraphQL actor as the REST API has it (deleted users are returned as null)"""
+
+    if actor is None:
+        return 'ghost'
+
+    # GraphQL leaves the [bot] suffix off the logins of apps (such as stale[bot])
+    if actor['__typename'] == 'Bot':
+        return actor['login'] + '[bot]'
+
+    return actor['login']
+
+
+def rest_comment(comment_node):
+    """Return a GraphQL comment in the shape returned by the REST API"""
+
+    return {
+        'id': comment_node['databaseId'],
+        'user': {
+            'login': login(comment_node['author'])
+        },
+        'body': comment_node['body'],
+        'created_at': comment_node['createdAt']
+    }
+
+
+def rest_issue(issue_node):
+    """Return a GraphQL issue in the shape returned by the REST API, with its comments included"""
+
+    comment_nodes = list(issue_node['comments']['nodes'])
+
+    # Only issues with more than a page of comments need more requests
+    page_info = issue_node['comments']['pageInfo']
+    while page_info['hasNextPage']:
+        comments = graphql(comments_query, {
+            'id': issue_node['id'],
+            'after': page_info['endCursor']
+        })['node']['comments']
+        comment_nodes.extend(comments['nodes'])
+        page_info = comments['pageInfo']
+
+    return {
+        'id': issue_node['databaseId'],
+        'node_id': issue_node['id'],
+        'number': issue_node['number'],
+        'title': issue_node['title'],
+        'body': issue_node['body'],
+        'html_url': issue_node['url'],
+        'comments_url': f'{base_url}/{issue_node["number"]}/comments',
+        'user': {
+            'login': login(issue_node['author'])
+        },
+        'labels': [{'name': label['name']} for label in issue_node['labels']['nodes']],
+        'assignees': [{'login': assignee['login']} for assignee in issue_node['assignees']['nodes']],
+        'fetched_comments': [rest_comment(comment) for comment in comment_nodes]
+    }
+
+
+def iter_issues_by_label_graphql(labels, pagination=50):
+    """Yield pages of issues by label with their comments, fetched with the GraphQL API"""
+    assert 0 < pagination <= 100  # pagination size needs to be set properly
+    assert labels                 # Labels cannot be None
+
+    global repo_database_id
+
+    owner, name = org_repo.split('/')
+    label_list = labels.split(',')
+    variables = {
+        'owner': owner,
+        'name': name,
+        'labels': label_list,
+        'pagination': pagination,
+        'after': None
+    }
+
+    while True:
+        repository = graphql(issues_query, variables)['repository']
+        repo_database_id = repository['databaseId']
+        issues = repository['issues']
+        if variables['after'] is None:
+            # Issues with any of the labels, so an upper bound for the progress ETA
+            metricsutils.expected_issues = issues['totalCount']
+
+        page = []
+        for issue_node in issues['nodes']:
+            # Label nodes have the same shape as the REST API's issue labels
+            issue_labels = {'labels': issue_node['labels']['nodes']}
+            # GraphQL matches issues with any of the labels, but the label filter needs all of them
+            if has_all_labels(issue_labels, label_list):
+                page.append(rest_issue(issue_node))
+        yield page
+
+        if not issues['pageInfo']['hasNextPage']:
+            break
+        variables['after'] = issues['pageInfo']['endCursor']
+
+
+def has_all_labels(issue, label_list):
+    """Whether an issue has every label in a list of label names"""
+
+    label_names = set(str(label['name']) for label in issue['labels'])
+
+    return all(label_name in label_names for label_name in label_list)
 
 
 def get_single_issue(issue_number):
     """Get specific issue data"""
 
     url = f'{base_url}/{issue_number}'
-    return requests.get(
-        url,
-        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN)
+    return httputils.request(
+        'github', 'GET', url
     ).json()
 
 
@@ -84,9 +429,8 @@ def close_issue(issue_number):
     data = {
         'state': 'closed'
     }
-    return requests.patch(
-        url,
-        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+    return httputils.request(
+        'github', 'PATCH', url,
         json=data
     ).json()
 
@@ -94,16 +438,20 @@ def close_issue(issue_number):
 def get_issue_comments(issue):
     """Get comments from given issue dict"""
 
-    comment_url = issue['comments_url']
+    # Issues fetched with GraphQL already include their comments
+    if 'fetched_comments' in issue:
+        issue_comments = issue['fetched_comments']
+    else:
+        comment_url = issue['comments_url']
 
-    response = requests.get(
-        comment_url,
-        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN)
-    )
+        response = httputils.request(
+            'github', 'GET', comment_url
+        )
+        issue_comments = response.json()
 
     # Omit comments from selected bots
     comments = []
-    comments.extend([comment for comment in response.json()
+    comments.extend([comment for comment in issue_comments
                     if comment['user']['login'] != 'stale[bot]' and comment['body'] != 'dependency_scan failed.'])
 
     return comments
@@ -118,9 +466,8 @@ def add_issue_label(issue_number, label):
         'labels': [label]
     }
 
-    response = requests.post(
-        url,
-        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+    response = httputils.request(
+        'github', 'POST', url,
         json=data
     )
 
@@ -136,10 +483,81 @@ def add_issue_comment(issue_number, comment):
         'body': comment
     }
 
-    response = requests.post(
-        url,
-        auth=(migrationauth.GH_USERNAME, migrationauth.GH_TOKEN),
+    response = httputils.request(
+        'github', 'POST', url,
         json=data
     )
 
     return response.json()
+
+
+def get_label_id(label):
+    """Get the node ID of a label in the current repo (None if the label doesn't exist yet)"""
+
+    with label_ids_lock:
+        label_id = label_ids.get((org_repo, label))
+    if label_id is not None:
+        return label_id
+
+    owner, name = org_repo.split('/')
+    repository = graphql(label_query, {
+        'owner': owner,
+        'name': name,
+        'label': label
+    })['repository']
+    if repository['label'] is None:
+        return None
+
+    label_id = repository['label']['id']
+    with label_ids_lock:
+        label_ids[(org_repo, label)] = label_id
+
+    return label_id
+
+
+def write_back_issues(write_backs):
+    """Add comments, add labels, and close issues for many issues in one GraphQL request, returning which actions succeeded for each"""
+
+    # Each action is an aliased mutation field (c0, l0, x0, ...), which GitHub runs in order
+    fields = []
+    parameters = []
+    variables = {}
+    for index, write_back in enumerate(write_backs):
+        parameters.append(f'$id{index}: ID!')
+        variables[f'id{index}'] = write_back['node_id']
+        for action in write_back['actions']:
+            prefix, mutation, arguments, parameter = write_back_fields[action]
+            fields.append(f'  {prefix}{index}: {mutation}(input: {{{arguments.format(index=index)}}}) {{\n'
+                          '    clientMutationId\n'
+                          '  }')
+            if parameter:
+                parameters.append(f'${parameter.format(index=index)}')
+                variables[f'{action}{index}'] = write_back[action]
+    query = f'mutation WriteBack({", ".join(parameters)}) {{\n' + \
+        '\n'.join(fields) + '\n}'
+
+    response = httputils.request(
+        'github', 'POST', graphql_url,
+        json={'query': query, 'variables': variables}
+    )
+
+    results = [{action: False for action in write_back['actions']}
+               for write_back in write_backs]
+    if not response.ok:
+        print(
+            f'* Batched write-back to GitHub failed: {response} {response.reason}')
+        return results
+
+    response_json = response.json()
+    data = response_json.get('data') or {}
+    failed_aliases = set()
+    for error in response_json.get('errors') or []:
+        print(f'* Batched write-back to GitHub returned an error: {error.get("message")}')
+        if error.get('path'):
+            failed_aliases.add(error['path'][0])
+    for index, write_back in enumerate(write_backs):
+        for action in write_back['actions']:
+            alias = f'{write_back_fields[action][0]}{index}'
+            results[index][action] = data.get(alias) is not None and not alias in failed_aliases
+
+    return results
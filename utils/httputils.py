@@ -0,0 +1,261 @@
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import time
+import uuid
+import utils.cassetteutils as cassetteutils
+import utils.metricsutils as metricsutils
+import utils.ratelimitutils as ratelimitutils
+
+# Number of connections kept alive per host for each service
+pool_size = 10
+sessions = {}
+# Caches (utils.cacheutils.Cache) of GET responses to revalidate with conditional requests, per service
+response_caches = {}
+# Response headers kept with cached responses
+cached_headers = ['Content-Type', 'ETag', 'Last-Modified', 'Link']
+# Token buckets (utils.ratelimitutils.TokenBucket) pacing the requests to each service
+rate_limiters = {}
+# Number of times a rate-limited request is retried after waiting
+rate_limit_retries = 5
+# Number of times a request answered with a server error is retried, and the seconds waited before the
+# first retry (doubled for each one after)
+server_error_retries = 3
+server_error_backoff = 1
+# Cassette (utils.cassetteutils.Cassette) that read responses are recorded to or replayed from
+cassette = None
+
+
+class MultipartFile:
+    """File-like multipart/form-data body that streams a single file part instead of building the body in memory"""
+
+    def __init__(self, field, file_name, content_type, file, size):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        preamble = (f'--{boundary}\r\n'
+                    f'Content-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+                    f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        epilogue = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        self.file = file
+        self.parts = [preamble, None, epilogue]
+        self.size = len(preamble) + size + len(epilogue)
+        self.seek(0)
+
+    def __len__(self):
+        return self.size
+
+    def seek(self, offset, whence=0):
+        """Rewind the body so a request can be sent again"""
+        assert offset == 0 and whence == 0  # only rewinding is supported
+
+        self.part = 0
+        self.part_offset = 0
+        self.file.seek(0)
+
+    def read(self, size=-1):
+        """Read up to size bytes of the body (the rest of it if size is negative)"""
+
+        chunks = []
+        while self.part < len(self.parts) and size != 0:
+            part = self.parts[self.part]
+            if part is None:
+                chunk = self.file.read(size)
+            else:
+                end = len(part) if size < 0 else self.part_offset + size
+                chunk = part[self.part_offset:end]
+                self.part_offset += len(chunk)
+            if len(chunk) == 0 or (part is not None and self.part_offset >= len(part)):
+                self.part += 1
+                self.part_offset = 0
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+
+        return b''.join(chunks)
+
+
+def mount_adapters(session):
+    """Mount connection-pooling adapters sized by pool_size on a session"""
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def register_session(service, auth=None, headers=None):
+    """Create the shared session for a service with its authentication and headers"""
+
+    session = requests.Session()
+    session.auth = auth
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    })
+    if headers:
+        session.headers.update(headers)
+    mount_adapters(session)
+    sessions[service] = session
+
+    return session
+
+
+def set_pool_size(size):
+    """Resize the connection pools of all registered sessions"""
+    assert size > 0  # pool size needs to be set properly
+
+    global pool_size
+    pool_size = size
+    for session in sessions.values():
+        mount_adapters(session)
+
+
+def set_rate_limit(service, rate, burst=None):
+    """Pace requests to a service to at most rate requests per second"""
+
+    rate_limiters[service] = ratelimitutils.TokenBucket(rate, burst)
+
+
+def enable_response_cache(service, cache):
+    """Revalidate GET responses for a service with conditional requests against a cache"""
+
+    response_caches[service] = cache
+
+
+def session_request(service, method, url, **kwargs):
+    """Send a single request through the shared session for a service, recording its metrics"""
+
+    start = time.perf_counter()
+    response = None
+    try:
+        response = sessions[service].request(method, url, **kwargs)
+    finally:
+        metricsutils.record_request(
+            service, method, url, kwargs.get('json'), response, time.perf_counter() - start,
+            kwargs.get('stream', False))
+
+    return response
+
+
+def cached_response(entry, response):
+    """Return a response built from a cache entry for a request that was answered with 304"""
+
+    cached = requests.Response()
+    cached.status_code = entry['status']
+    cached.reason = entry['reason']
+    cached.headers = CaseInsensitiveDict(entry['headers'])
+    cached.encoding = 'utf-8'
+    cached._content = entry['body'].encode('utf-8')
+    cached.url = entry['url']
+    cached.request = response.request
+    cached.elapsed = response.elapsed
+    cached.from_cache = True
+
+    return cached
+
+
+def conditional_request(service, cache, url, **kwargs):
+    """Send a GET request, revalidating a cached response with its ETag or Last-Modified date"""
+
+    cache_key = requests.Request(
+        'GET', url, params=kwargs.get('params')).prepare().url
+    entry = cache.get(cache_key)
+
+    headers = dict(kwargs.pop('headers', None) or {})
+    if entry:
+        if 'ETag' in entry['headers']:
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if 'Last-Modified' in entry['headers']:
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+    response = session_request(service, 'GET', url, headers=headers, **kwargs)
+
+    # An unchanged resource comes back as 304 without a body (and doesn't count against GitHub's rate limit)
+    if response.status_code == 304 and entry:
+        return cached_response(entry, response)
+
+    if response.ok and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+        cache.set(cache_key, {
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {name: response.headers[name] for name in cached_headers if name in response.headers},
+            'body': response.text,
+            'url': response.url
+        })
+
+    return response
+
+
+def send(service, method, url, **kwargs):
+    """Send a request through the shared session for a service, revalidating cached GETs"""
+
+    cache = response_caches.get(service)
+    if method == 'GET' and cache is not None:
+        return conditional_request(service, cache, url, **kwargs)
+
+    return session_request(service, method, url, **kwargs)
+
+
+def is_retryable(response, is_write):
+    """Whether a request answered with a server error can be sent again"""
+
+    # A write may have gone through before the error, so only writes the service didn't take (503) are sent again
+    return response.status_code >= 500 and (not is_write or response.status_code == 503)
+
+
+def paced_request(service, method, url, is_write, **kwargs):
+    """Send a request through the shared session for a service, waiting out its rate limits and retrying server errors"""
+
+    limiter = rate_limiters.get(service)
+    rate_limited = 0
+    server_errors = 0
+    while True:
+        if rate_limited + server_errors > 0:
+            metricsutils.record_retry(service, method, url, kwargs.get('json'))
+            # Streamed bodies were read by the last attempt
+            if hasattr(kwargs.get('data'), 'seek'):
+                kwargs['data'].seek(0)
+        if limiter is not None:
+            limiter.acquire(is_write)
+        response = send(service, method, url, **kwargs)
+
+        if limiter is not None and limiter.observe(response):
+            if rate_limited == rate_limit_retries:
+                return response
+            rate_limited += 1
+        elif is_retryable(response, is_write) and server_errors < server_error_retries:
+            delay = server_error_backoff * 2 ** server_errors
+            print(f'* Server error {response.status_code} from {response.url}, retrying in {delay} seconds')
+            time.sleep(delay)
+            server_errors += 1
+        else:
+            return response
+        response.close()
+
+
+def request(service, method, url, is_write=None, **kwargs):
+    """Send a request through the shared session for a service, or replay it from the cassette"""
+
+    # Writes go ahead of speculative reads when the rate limit runs short. Requests other
+    # than GET are writes unless the caller says otherwise (such as searches sent with POST).
+    if is_write is None:
+        is_write = method != 'GET'
+
+    if cassette is None:
+        return paced_request(service, method, url, is_write, **kwargs)
+
+    key = cassetteutils.request_key(
+        service, method, url, kwargs.get('params'), kwargs.get('json'), kwargs.get('data'))
+    if cassette.replaying:
+        response = cassette.replay(key)
+        if response is None:
+            print(f'* Error: No response to {method} {url} ({service}) was recorded in {cassette.path}. '
+                  'Record the cassette again with --record.')
+            exit(1)
+        return response
+
+    response = paced_request(service, method, url, is_write, **kwargs)
+    # Only reads are recorded (files are streamed and not recorded), and not failures that may not happen again
+    if not is_write and not kwargs.get('stream') and response.status_code != 429 and response.status_code < 500:
+        cassette.record(key, response)
+
+    return response
@@ -1,5 +1,6 @@
 import migrationauth
-import requests
+import threading
+import utils.httputils as httputils
 
 root_url = 'https://issues.redhat.com'
 base_url = f'{root_url}/rest/api/latest'
@@ -12,6 +13,23 @@ epic_field = 'customfield_12311141'
 gh_issue_field = 'customfield_12316846'
 severity_field = 'customfield_12316142'
 story_points_field = 'customfield_12310243'
+# Workflow graphs learned from the transitions endpoint, per issue type:
+# {issue type: {'initial': status, 'edges': {status: {to status: transition ID}}, 'aliases': {transition: status}}}
+workflows = {}
+workflows_lock = threading.Lock()
+# Create metadata indexed by issue type (populated by get_project_meta)
+project_meta = None
+project_meta_lock = threading.Lock()
+# Cache (a utils.cacheutils.Cache) to keep create metadata in between runs
+meta_cache = None
+# Maximum number of transitions taken to reach a status
+max_transition_hops = 10
+# Maximum number of issues Jira accepts in a single bulk create request
+bulk_create_limit = 50
+# Longest comment body Jira accepts, in characters
+max_comment_length = 32767
+# JQL reference to the custom "GitHub Issue" field
+gh_issue_jql_field = f'cf[{gh_issue_field.split("_")[1]}]'
 data = {
     'projectKeys': project_key
 }
@@ -20,6 +38,8 @@ headers = {
     'Content-Type': 'application/json',
 }
 
+httputils.register_session('jira', headers=headers)
+
 
 def get_user(user_query):
     """Get user object from query (username, name, or e-mail)"""
@@ -29,9 +49,8 @@ def get_user(user_query):
         'username': user_query
     }
 
-    response = requests.get(
-        url,
-        headers=headers,
+    response = httputils.request(
+        'jira', 'GET', url,
         params=data,
     )
 
@@ -48,31 +67,122 @@ def get_issue_types():
 
     url = f'{issue_url}/createmeta'
 
-    response = requests.get(
-        url,
-        headers=headers,
+    response = httputils.request(
+        'jira', 'GET', url,
         params=data,
     )
 
     return response.json()['projects'][0]['issuetypes']
 
 
+def get_project_meta():
+    """Get create metadata with fields for every issue type in the project, fetching it once per run"""
+
+    global project_meta
+
+    with project_meta_lock:
+        if project_meta is not None:
+            return project_meta
+
+        cache_key = f'createmeta/{project_key}'
+        issue_types = None
+        if meta_cache:
+            issue_types = meta_cache.get(cache_key)
+
+        if issue_types is None:
+            request_data = dict(data)
+            request_data['expand'] = 'projects.issuetypes.fields'
+
+            url = f'{issue_url}/createmeta'
+
+            response = httputils.request(
+                'jira', 'GET', url,
+                params=request_data,
+            )
+
+            if not response.ok:
+                print(
+                    f'* An unexpected response was returned from Jira: {response} {response.reason}')
+                exit(1)
+
+            issue_types = response.json()['projects'][0]['issuetypes']
+            if meta_cache:
+                meta_cache.set(cache_key, issue_types)
+
+        project_meta = index_project_meta(issue_types)
+
+    return project_meta
+
+
+def index_project_meta(issue_types):
+    """Return create metadata indexed by issue type with sets of the allowed values of each field"""
+
+    index = {}
+    for issue_type in issue_types:
+        allowed_values = {}
+        required_fields = set()
+        for field_id, field in issue_type['fields'].items():
+            if 'allowedValues' in field:
+                allowed_values[field_id] = set()
+                for allowed_value in field['allowedValues']:
+                    for key in ['id', 'key', 'name', 'value']:
+                        if key in allowed_value:
+                            allowed_values[field_id].add(
+                                str(allowed_value[key]))
+            if field.get('required') and not field.get('hasDefaultValue'):
+                required_fields.add(field_id)
+
+        index[issue_type['name']] = {
+            'meta': issue_type,
+            'allowed_values': allowed_values,
+            'required_fields': required_fields
+        }
+
+    return index
+
+
 def get_issue_meta(issue_type_name):
-    """Get meta fields for an issue type"""
+    """Get meta fields for an issue type (None if the project has no such issue type)"""
 
-    request_data = data
-    request_data['issuetypeNames'] = issue_type_name
-    request_data['expand'] = 'projects.issuetypes.fields'
+    issue_type_meta = get_project_meta().get(issue_type_name)
+    if issue_type_meta is None:
+        return None
 
-    url = f'{issue_url}/createmeta'
+    return issue_type_meta['meta']
 
-    response = requests.get(
-        url,
-        headers=headers,
-        params=request_data,
-    )
 
-    return response.json()['projects'][0]['issuetypes'][0]
+def validate_issue(props):
+    """Return a list of problems Jira would reject the mapped props for, checked against the create metadata"""
+
+    project_meta = get_project_meta()
+    issue_type_name = props['issuetype']['name']
+    if not issue_type_name in project_meta:
+        return [f'Issue type "{issue_type_name}" does not exist in project {project_key}']
+
+    issue_type_meta = project_meta[issue_type_name]
+    fields = issue_fields(props)
+    errors = []
+
+    for field_id in issue_type_meta['required_fields']:
+        if fields.get(field_id) in [None, '', [], {}]:
+            errors.append(f'Required field "{field_id}" is empty')
+
+    for field_id, field_value in fields.items():
+        if not field_id in issue_type_meta['allowed_values'] or not field_value:
+            continue
+        values = field_value if isinstance(field_value, list) else [field_value]
+        for value in values:
+            # Options are objects (matched by ID, key, name, or value), but some fields take plain strings
+            if isinstance(value, dict):
+                value_names = [str(value[key])
+                               for key in ['id', 'key', 'name', 'value'] if key in value]
+            else:
+                value_names = [str(value)]
+            if not any(name in issue_type_meta['allowed_values'][field_id] for name in value_names):
+                errors.append(
+                    f'Value {value} is not allowed for field "{field_id}"')
+
+    return errors
 
 
 def get_transitions(issue_key):
@@ -83,38 +193,155 @@ def get_transitions(issue_key):
         'expand': 'transitions.fields'
     }
 
-    return requests.get(
-        url,
-        headers=headers,
+    return httputils.request(
+        'jira', 'GET', url,
         json=data
     ).json()
 
 
-def do_transition(issue_key, target_status_name):
-    """Execute a transition for an issue"""
+def get_issue_status(issue_key):
+    """Get the name of the current status of an issue"""
+
+    url = f'{issue_url}/{issue_key}'
+    data = {
+        'fields': 'status'
+    }
+
+    return httputils.request(
+        'jira', 'GET', url,
+        params=data
+    ).json()['fields']['status']['name']
+
 
-    target_status = None
-    transition_response = get_transitions(issue_key)
-    for transition in transition_response['transitions']:
-        if target_status_name == transition['name']:
-            target_status = {'id': transition['id']}
+def post_transition(issue_key, transition_id):
+    """Execute a single transition for an issue"""
 
     url = f'{issue_url}/{issue_key}/transitions'
     data = {
-        'transition': target_status
+        'transition': {'id': transition_id}
     }
 
-    return requests.post(
-        url,
-        headers=headers,
+    return httputils.request(
+        'jira', 'POST', url,
         json=data
     )
 
 
-def create_issue(props):
-    """Create Jira issue"""
+def learn_transitions(workflow, issue_key, status_name):
+    """Record the transitions available from an issue's current status in a workflow graph"""
+
+    edges = {}
+    aliases = {}
+    terminal = set()
+    for transition in get_transitions(issue_key)['transitions']:
+        edges[transition['to']['name']] = transition['id']
+        aliases[transition['name']] = transition['to']['name']
+        if transition['to'].get('statusCategory', {}).get('key') == 'done':
+            terminal.add(transition['to']['name'])
+
+    with workflows_lock:
+        workflow['edges'][status_name] = edges
+        workflow['terminal'].update(terminal)
+        # Target statuses may be given by transition name rather than status name
+        for transition_name in aliases:
+            workflow['aliases'].setdefault(
+                transition_name, aliases[transition_name])
+
+
+def find_transition_path(workflow, from_status, is_target):
+    """Return the shortest list of (transition ID, status) hops to a status matching is_target"""
+
+    with workflows_lock:
+        edges = {status: dict(status_edges)
+                 for status, status_edges in workflow['edges'].items()}
+        terminal = set(workflow['terminal'])
+
+    paths = {from_status: []}
+    queue = [from_status]
+    for status in queue:
+        if is_target(status):
+            return paths[status]
+        for to_status, transition_id in edges.get(status, {}).items():
+            # Done statuses (such as Closed) may set a resolution or notify watchers, so they're only entered as the target
+            if to_status in terminal and not is_target(to_status):
+                continue
+            if not to_status in paths:
+                paths[to_status] = paths[status] + [(transition_id, to_status)]
+                queue.append(to_status)
+
+    return None
+
+
+def do_transition(issue_key, target_status_name, issue_type_name='', current_status=None):
+    """Transition an issue to a status through as many transitions as needed, returning whether it got there and the last response"""
+
+    # The workflow graph of each issue type is learned from the transitions endpoint once per
+    # status and reused for later issues of the same type, so most issues need no GET requests
+    with workflows_lock:
+        workflow = workflows.setdefault(
+            issue_type_name, {'initial': None, 'edges': {}, 'aliases': {}, 'terminal': set()})
+        is_new = current_status is None
+        if is_new:
+            current_status = workflow['initial']
+
+    # New issues of a type all start in the same status, so it only needs to be fetched once
+    if is_new and current_status is None:
+        current_status = get_issue_status(issue_key)
+        with workflows_lock:
+            workflow['initial'] = current_status
+
+    start_status = current_status
+    response = None
+    relearned = False
+    hops = 0
+    while hops < max_transition_hops:
+        with workflows_lock:
+            target_status = workflow['aliases'].get(
+                target_status_name, target_status_name)
+            is_learned = current_status in workflow['edges']
+        if current_status == target_status:
+            return True, response
+
+        if not is_learned:
+            learn_transitions(workflow, issue_key, current_status)
+
+        path = find_transition_path(
+            workflow, current_status, lambda status: status == target_status)
+        if path is None:
+            # Head for the nearest status whose transitions haven't been learned yet (other than done statuses,
+            # which are never passed through)
+            path = find_transition_path(
+                workflow, current_status,
+                lambda status: not status in workflow['edges'] and not status in workflow['terminal'])
+        if not path:
+            break
+
+        transition_id, next_status = path[0]
+        response = post_transition(issue_key, transition_id)
+        if not response.ok:
+            if relearned:
+                print(
+                    f'* Error: Transition of {issue_key} to {next_status} failed, leaving it in {current_status}: '
+                    f'{response} {response.reason}')
+                return False, response
+            # This issue's transitions may differ from the learned graph (e.g. conditions), so learn them again
+            relearned = True
+            learn_transitions(workflow, issue_key, current_status)
+            continue
+
+        current_status = next_status
+        hops += 1
+
+    print(
+        f'* Error: No transition path found for {issue_key} from {start_status} to {target_status_name}, '
+        f'leaving it in {current_status}')
+
+    return False, response
+
+
+def issue_fields(props):
+    """Return the Jira fields for creating an issue from mapped props"""
 
-    url = issue_url
     issue_type = props['issuetype']
     request_data = {
         'project': {
@@ -147,21 +374,67 @@ def create_issue(props):
         # Custom "Severity" field
         request_data[severity_field] = props[severity_field]
 
-    response = requests.post(
-        url,
-        json={'fields': request_data},
-        headers=headers,
+    return request_data
+
+
+def create_issue(props):
+    """Create Jira issue (the response has no key if creation failed)"""
+
+    url = issue_url
+
+    response = httputils.request(
+        'jira', 'POST', url,
+        json={'fields': issue_fields(props)},
     )
 
     if not response.ok:
         print(
             f'* An unexpected response was returned from Jira: {response} {response.reason}')
         print(response.json())
-        exit(1)
 
     return response.json()
 
 
+def create_issues(props_list):
+    """Create Jira issues in bulk, returning a creation response or error dict for each props"""
+    assert 0 < len(props_list) <= bulk_create_limit  # bulk size needs to be set properly
+
+    url = f'{issue_url}/bulk'
+
+    response = httputils.request(
+        'jira', 'POST', url,
+        json={'issueUpdates': [{'fields': issue_fields(props)} for props in props_list]},
+    )
+
+    try:
+        response_json = response.json()
+    except ValueError:
+        response_json = {}
+
+    if not 'errors' in response_json:
+        # The request failed as a whole rather than for individual issues
+        print(
+            f'* An unexpected response was returned from Jira: {response} {response.reason}')
+        return [{'errors': response_json} for _ in props_list]
+
+    failed_elements = {}
+    for error in response_json['errors']:
+        failed_elements[error['failedElementNumber']] = {
+            'errors': error['elementErrors']
+        }
+
+    # Created issues are returned in request order with failed elements left out
+    created_issues = iter(response_json.get('issues', []))
+    results = []
+    for element_number in range(len(props_list)):
+        if element_number in failed_elements:
+            results.append(failed_elements[element_number])
+        else:
+            results.append(next(created_issues, {}))
+
+    return results
+
+
 def update_issue(issue_key, data):
     """Update existing Jira issue"""
 
@@ -172,9 +445,8 @@ def update_issue(issue_key, data):
         'fields': data
     }
 
-    return requests.put(
-        url,
-        headers=headers,
+    return httputils.request(
+        'jira', 'PUT', url,
         json=request_data
     )
 
@@ -182,9 +454,8 @@ def update_issue(issue_key, data):
 def get_issue_from_url(api_url):
     """Get specific issue data given API URL"""
 
-    return requests.get(
-        api_url,
-        headers=headers,
+    return httputils.request(
+        'jira', 'GET', api_url,
     )
 
 
@@ -198,21 +469,71 @@ def get_single_issue(issue_key):
     return response.json()
 
 
-def search_issues(jql_query):
+def search_issues(jql_query, fields=None, start_at=0, max_results=None):
     """Get issues based on JQL query"""
 
     url = f'{base_url}/search'
 
-    return requests.post(
-        url,
-        headers=headers,
-        json={
-            'jql': jql_query,
-            # 'fields': ['status']
-        }
+    request_data = {
+        'jql': jql_query,
+        'startAt': start_at,
+        # 'fields': ['status']
+    }
+    if fields is not None:
+        request_data['fields'] = fields
+    if max_results is not None:
+        request_data['maxResults'] = max_results
+
+    return httputils.request(
+        'jira', 'POST', url, is_write=False,
+        json=request_data
     ).json()
 
 
+def get_linked_issues(pagination=1000):
+    """Get dict of GitHub issue URLs to the keys of Jira issues linked to them"""
+
+    jql_query = f'project = {project_key} AND {gh_issue_jql_field} is not EMPTY'
+    linked_issues = {}
+    start_at = 0
+
+    while True:
+        # Only request the "GitHub Issue" field since only the URL and key are needed
+        response = search_issues(
+            jql_query, fields=[gh_issue_field], start_at=start_at, max_results=pagination)
+        if not 'issues' in response:
+            print(
+                f'* An unexpected response was returned from Jira: {response}')
+            exit(1)
+
+        for issue in response['issues']:
+            gh_issue_url = issue['fields'][gh_issue_field]
+            linked_issues.setdefault(gh_issue_url, []).append(issue['key'])
+
+        start_at += len(response['issues'])
+        if len(response['issues']) == 0 or start_at >= response['total']:
+            break
+
+    return linked_issues
+
+
+def add_attachment(issue_key, file_name, content_type, file, size):
+    """Upload a file to an issue's attachments, streaming it from a file object, and return the response"""
+
+    url = f'{issue_url}/{issue_key}/attachments'
+    body = httputils.MultipartFile('file', file_name, content_type, file, size)
+
+    return httputils.request(
+        'jira', 'POST', url,
+        data=body,
+        headers={
+            'Content-Type': body.content_type,
+            # Required by Jira for attachment uploads
+            'X-Atlassian-Token': 'no-check'
+        }
+    )
+
+
 def add_comment(issue_key, props):
     """Add comment given issue key and props"""
 
@@ -232,9 +553,8 @@ def add_comment_from_url(api_url, props):
         'body': props['body']
     }
 
-    response = requests.post(
-        api_url,
-        headers=headers,
+    response = httputils.request(
+        'jira', 'POST', api_url,
         json=request_data
     )
 
@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+
+# Stages completed for each GitHub issue, in the order they happen
+stages = [
+    'mapped',
+    'created',
+    'attachments',
+    'comment',
+    'transitioned',
+    'commented_back',
+    'labelled',
+    'closed',
+]
+
+
+class Journal:
+    """Append-only JSON lines journal of the migration stages completed for each GitHub issue"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.states = {}
+
+        if resume and os.path.exists(path):
+            journal_file = open(path)
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if the previous run was killed mid-write
+                    continue
+                self.apply(entry)
+            journal_file.close()
+
+        self.file = open(path, 'a' if resume else 'w')
+
+    def apply(self, entry):
+        """Update the in-memory state of an issue from a journal entry"""
+
+        state = self.states.setdefault(entry['issue'], {'comments': []})
+        if entry['stage'] == 'comment':
+            state['comments'].append(entry['index'])
+        else:
+            state[entry['stage']] = entry.get('data', True)
+
+    def record(self, gh_issue_url, stage, data=None, index=None):
+        """Durably record that a stage was completed for a GitHub issue"""
+        assert stage in stages  # stage needs to be known
+
+        entry = {
+            'issue': gh_issue_url,
+            'stage': stage
+        }
+        if data is not None:
+            entry['data'] = data
+        if index is not None:
+            entry['index'] = index
+
+        with self.lock:
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.apply(entry)
+
+    def get(self, gh_issue_url):
+        """Return the recorded state of a GitHub issue (an empty state if never recorded)"""
+
+        with self.lock:
+            state = self.states.get(gh_issue_url, {'comments': []})
+            return dict(state, comments=set(state['comments']))
+
+    def is_complete(self, gh_issue_url):
+        """Whether every stage has been recorded for a GitHub issue"""
+
+        state = self.get(gh_issue_url)
+        # Issues with a comment, transition, or write-back that failed are finished by a later run
+        for stage in ['mapped', 'transitioned', 'commented_back', 'labelled']:
+            if not stage in state:
+                return False
+        if len(state['comments']) < len(state['mapped']['comments']):
+            return False
+
+        return 'closed' in state or not state['mapped']['close_gh_issue']
+
+    def incomplete_mappings(self, skip_urls):
+        """Return recorded mappings of unfinished issues, except for the given GitHub issue URLs"""
+
+        with self.lock:
+            gh_issue_urls = [gh_issue_url for gh_issue_url in self.states
+                             if not gh_issue_url in skip_urls and 'mapped' in self.states[gh_issue_url]]
+
+        return [self.get(gh_issue_url)['mapped'] for gh_issue_url in gh_issue_urls
+                if not self.is_complete(gh_issue_url)]
+
+    def close(self):
+        """Close the journal file"""
+
+        with self.lock:
+            self.file.close()
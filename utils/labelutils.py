@@ -0,0 +1,117 @@
+from functools import lru_cache
+
+# Default GitHub label to Jira field mappings (each can be replaced in config.json)
+default_type_map = {
+    'task': 'Task',
+    'bug': 'Bug',
+    'user_story': 'Story',
+    'Epic': 'Epic'
+}
+default_priority_map = {
+    'blocker (P0)': 'Blocker',
+    'Priority/P1': 'Critical',
+    'Priority/P2': 'Normal',
+    'Priority/P3': 'Minor',
+}
+default_severity_map = {
+    'Severity 1 - Urgent': 'Critical',
+    'Severity 2 - Major': 'Moderate',
+    'Severity 3 - Minor': 'Low',
+}
+# Labels signaling an issue should not be closed after migration
+default_no_close_labels = 'bugzilla,canary-failure'
+
+default_issue_type = 'Task'
+default_priority = 'Undefined'
+
+
+@lru_cache(maxsize=None)
+def label_set(label_query):
+    """Return the set of label names in a comma separated list"""
+
+    return frozenset(label_query.split(','))
+
+
+class LabelRules:
+    """Label mapping rules compiled into a single lookup table, evaluated in one pass over an issue's labels"""
+
+    def __init__(self, component_map=None, type_map=None, priority_map=None, severity_map=None,
+                 no_close_labels=None, label_exclusions=''):
+        if type_map is None:
+            type_map = default_type_map
+        if priority_map is None:
+            priority_map = default_priority_map
+        if severity_map is None:
+            severity_map = default_severity_map
+        if no_close_labels is None:
+            no_close_labels = default_no_close_labels
+
+        # Dict of label name to the (rule, value) pairs it triggers
+        self.rules = {}
+        for label_name, component in (component_map or {}).items():
+            self.add(label_name, 'component', component)
+        for label_name, issue_type in type_map.items():
+            self.add(label_name, 'type', issue_type)
+        for label_name, priority in priority_map.items():
+            # An empty priority leaves the label unmapped
+            if priority != '':
+                self.add(label_name, 'priority', priority)
+        for label_name, severity in severity_map.items():
+            if severity != '':
+                self.add(label_name, 'severity', severity)
+        for label_name in label_set(no_close_labels):
+            self.add(label_name, 'no_close', True)
+        for label_name in label_set(label_exclusions):
+            self.add(label_name, 'excluded', True)
+
+    def add(self, label_name, rule, value):
+        """Add a rule triggered by a label"""
+
+        if label_name != '':
+            self.rules.setdefault(label_name, []).append((rule, value))
+
+    def evaluate(self, gh_labels):
+        """Return the Jira fields and migration flags for a list of GitHub labels"""
+
+        result = {
+            'type': None,
+            'priority': None,
+            'severity': None,
+            'components': [],
+            'component_count': 0,
+            'is_ui': False,
+            'no_close': False,
+            'excluded': False
+        }
+
+        for label in gh_labels:
+            label_name = str(label['name'])
+            is_squad = label_name.startswith('squad:')
+            if is_squad:
+                # Squad labels count as components even when they aren't mapped
+                result['component_count'] += 1
+            label_rules = self.rules.get(label_name)
+            if label_rules is None:
+                continue
+
+            for rule, value in label_rules:
+                if rule == 'component':
+                    result['components'].append({'name': value})
+                    if is_squad:
+                        if label_name.endswith('-ui'):
+                            result['is_ui'] = True
+                    else:
+                        result['component_count'] += 1
+                elif rule in ('type', 'priority', 'severity'):
+                    # The first matching label wins
+                    if result[rule] is None:
+                        result[rule] = value
+                else:
+                    result[rule] = True
+
+        if result['type'] is None:
+            result['type'] = default_issue_type
+        if result['priority'] is None:
+            result['priority'] = default_priority
+
+        return result
@@ -0,0 +1,441 @@
+from functools import lru_cache
+import re
+
+# Characters that may start inline markup (everything else is copied through as is)
+special_characters = re.compile(r'[\\`!\[\]<*_~{}\-+^?]')
+# Tokens of the Jira text effects (strikethrough, inserted, superscript, subscript, and citation) that
+# plain text may pair up into, by their first character
+jira_effects = {'-': '-', '+': '+', '^': '^', '~': '~', '?': '??'}
+# Punctuation that a backslash escapes in Markdown
+escapable = '\\`*_{}[]()#+-.!|~<>'
+# Markers that open and close fenced code blocks
+fence_markers = ('```', '~~~')
+# Jira markup for checked and unchecked task list items (Jira has no neutral icon for an open task, and
+# its (x) icon reads as failed)
+task_icons = {'[ ]': '\\[ \\]', '[x]': '(/)', '[X]': '(/)'}
+# Bodies up to this many characters are memoized, in up to this many entries (GitHub allows bodies of
+# 65,536 characters, so memoizing any size could hold hundreds of MB)
+memoized_body_size = 16 * 1024
+memoized_bodies = 1024
+
+
+class InlineScanner:
+    """Single pass converter of the inline Markdown in a line of text to Jira wiki markup"""
+
+    def __init__(self, text):
+        self.text = text
+        # The next position of each delimiter and where it was searched from, so no stretch of the
+        # line is searched twice for the same delimiter (which keeps unclosed delimiters linear)
+        self.next_positions = {}
+        # The same for emphasis closers, which may skip over delimiters inside words
+        self.next_closers = {}
+        # The same for the closers of Jira text effects
+        self.next_effect_closers = {}
+
+    def find(self, token, start):
+        """Return the position of the next token from start (-1 if there is none)"""
+
+        cached = self.next_positions.get(token)
+        if cached is not None and cached[0] <= start and (cached[1] == -1 or cached[1] >= start):
+            return cached[1]
+
+        position = self.text.find(token, start)
+        self.next_positions[token] = (start, position)
+
+        return position
+
+    def find_closer(self, token, start):
+        """Return the position of the next token from start that can close emphasis (-1 if there is none)"""
+
+        cached = self.next_closers.get(token)
+        if cached is not None and cached[0] <= start and (cached[1] == -1 or cached[1] >= start):
+            return cached[1]
+
+        position = self.find(token, start)
+        # Underscores inside words (such as snake_case names) aren't emphasis
+        while position != -1 and token[0] == '_' and self.is_word(position + len(token)):
+            position = self.find(token, position + len(token))
+        self.next_closers[token] = (start, position)
+
+        return position
+
+    def find_effect_closer(self, token, start):
+        """Return the position of the next token from start that Jira would read as closing a text effect (-1 if there is none)"""
+
+        cached = self.next_effect_closers.get(token)
+        if cached is not None and cached[0] <= start and (cached[1] == -1 or cached[1] >= start):
+            return cached[1]
+
+        position = self.find(token, start)
+        # Jira only closes an effect after text and before the end of a word
+        while position != -1 and (self.text[position - 1].isspace() or self.is_word(position + len(token))):
+            position = self.find(token, position + len(token))
+        self.next_effect_closers[token] = (start, position)
+
+        return position
+
+    def is_effect(self, position, token):
+        """Whether Jira would read a token at a position as opening a text effect that's closed later on"""
+
+        text = self.text
+        start = position + len(token)
+        if start >= len(text) or text[start].isspace() or text[start] == token[0] or self.is_word(position - 1):
+            return False
+
+        return self.find_effect_closer(token, start + 1) != -1
+
+    def link_target(self, start):
+        """Return the end of a (url) after a ] at start and the URL (None if there isn't one)"""
+
+        if self.text[start + 1:start + 2] != '(':
+            return None, None
+        end = self.find(')', start + 2)
+        if end == -1:
+            return None, None
+        # Drop an optional "title" after the URL
+        parts = self.text[start + 2:end].split()
+        if len(parts) == 0:
+            return None, None
+
+        return end, parts[0].strip('<>')
+
+    def is_word(self, position):
+        """Whether the character at a position is part of a word"""
+
+        return 0 <= position < len(self.text) and self.text[position].isalnum()
+
+    def emphasis(self, position, token, jira_token):
+        """Convert emphasis opened at a position, returning the markup and where it ends (None if not emphasis)"""
+
+        text = self.text
+        start = position + len(token)
+        if start >= len(text) or text[start].isspace():
+            return None, position
+        if token[0] == '_' and self.is_word(position - 1):
+            return None, position
+
+        end = self.find_closer(token, start)
+        if end == -1 or end == start or text[end - 1].isspace():
+            return None, position
+
+        return jira_token + convert_inline(text[start:end]) + jira_token, end + len(token)
+
+    def convert(self):
+        """Return the converted text"""
+
+        text = self.text
+        output = []
+        position = 0
+        while position < len(text):
+            match = special_characters.search(text, position)
+            if match is None:
+                output.append(text[position:])
+                break
+            if match.start() > position:
+                output.append(text[position:match.start()])
+            position = match.start()
+            character = text[position]
+            markup = None
+            end = position + 1
+
+            if character == '\\' and text[position + 1:position + 2] in escapable and position + 1 < len(text):
+                markup = text[position:position + 2]
+                end = position + 2
+            elif character == '`':
+                run = position
+                while run < len(text) and text[run] == '`':
+                    run += 1
+                token = text[position:run]
+                close = self.find(token, run)
+                if close != -1:
+                    code = text[run:close].strip()
+                    markup = '{{' + code.replace('{', '\\{').replace('}', '\\}') + '}}'
+                    end = close + len(token)
+                else:
+                    markup = token
+                    end = run
+            elif character == '!' and text[position + 1:position + 2] == '[':
+                close = self.find(']', position + 2)
+                if close != -1:
+                    target_end, url = self.link_target(close)
+                    if url is not None:
+                        markup = f'!{url}!'
+                        end = target_end + 1
+            elif character == '[':
+                close = self.find(']', position + 1)
+                if close != -1:
+                    target_end, url = self.link_target(close)
+                    if url is not None:
+                        label = text[position + 1:close]
+                        if label == url or label == '':
+                            markup = f'[{url}]'
+                        else:
+                            markup = f'[{convert_inline(label)}|{url}]'
+                        end = target_end + 1
+                if markup is None:
+                    markup = '\\['
+            elif character == ']':
+                markup = '\\]'
+            elif character == '<':
+                close = self.find('>', position + 1)
+                if close != -1:
+                    tag = text[position + 1:close]
+                    if tag.startswith(('http://', 'https://')) and not ' ' in tag:
+                        markup = f'[{tag}]'
+                        end = close + 1
+                    elif tag.startswith('img '):
+                        src = re.search(r'src="([^"]*)"', tag)
+                        if src:
+                            markup = f'!{src.group(1)}!'
+                            end = close + 1
+                    elif tag in ('br', 'br/', 'br /'):
+                        markup = '\\\\'
+                        end = close + 1
+            elif character in '*_':
+                token = character * 2 if text[position + 1:position + 2] == character else character
+                markup, end = self.emphasis(
+                    position, token, '*' if len(token) == 2 else '_')
+                if markup is None:
+                    markup = token
+                    end = position + len(token)
+            elif character == '~' and text[position + 1:position + 2] == '~':
+                markup, end = self.emphasis(position, '~~', '-')
+                if markup is None:
+                    markup = '~~'
+                    end = position + 2
+            elif character in jira_effects:
+                token = jira_effects[character]
+                if text.startswith(token, position) and self.is_effect(position, token):
+                    # Plain text would otherwise turn into a Jira text effect (such as -x- into strikethrough)
+                    markup = '\\' + token
+                    end = position + len(token)
+            elif character in '{}':
+                # Braces start macros in Jira
+                markup = '\\' + character
+
+            output.append(character if markup is None else markup)
+            position = end
+
+        return ''.join(output)
+
+
+def convert_inline(text):
+    """Convert the inline Markdown of a line (emphasis, code, links, and images) to Jira wiki markup"""
+
+    return InlineScanner(text).convert()
+
+
+def split_cells(line):
+    """Return the cells of a Markdown table row"""
+
+    cells = []
+    cell = []
+    position = 0
+    stripped = line.strip()
+    if stripped.startswith('|'):
+        stripped = stripped[1:]
+    if stripped.endswith('|') and not stripped.endswith('\\|'):
+        stripped = stripped[:-1]
+    while position < len(stripped):
+        character = stripped[position]
+        if character == '\\' and stripped[position + 1:position + 2] == '|':
+            # The pipe stays escaped, since Jira would otherwise read it as the end of the cell
+            cell.append('\\|')
+            position += 2
+            continue
+        if character == '|':
+            cells.append(''.join(cell).strip())
+            cell = []
+        else:
+            cell.append(character)
+        position += 1
+    cells.append(''.join(cell).strip())
+
+    return cells
+
+
+def is_table_separator(line):
+    """Whether a line is the separator under the header of a Markdown table"""
+
+    stripped = line.strip()
+
+    return '-' in stripped and '|' in stripped and stripped.strip('|-: ') == ''
+
+
+def table_row(cells, separator):
+    """Return a Jira table row from Markdown cells"""
+
+    return separator + separator.join(convert_inline(cell) or ' ' for cell in cells) + separator
+
+
+def list_item(stripped):
+    """Return the Jira list marker and text of a Markdown list item (None if the line isn't one)"""
+
+    if stripped[:2] in ('- ', '* ', '+ '):
+        return '*', stripped[2:]
+
+    digits = 0
+    while digits < len(stripped) and stripped[digits].isdigit():
+        digits += 1
+    if 0 < digits <= 9 and stripped[digits:digits + 2] in ('. ', ') '):
+        return '#', stripped[digits + 2:]
+
+    return None, None
+
+
+def is_rule(stripped):
+    """Whether a line is a horizontal rule"""
+
+    compact = stripped.replace(' ', '')
+
+    return len(compact) >= 3 and compact[0] in '-*_' and compact == compact[0] * len(compact)
+
+
+def convert(markdown):
+    """Convert GitHub Markdown to Jira wiki markup in one pass over its lines"""
+
+    if not markdown:
+        return ''
+
+    lines = markdown.replace('\r\n', '\n').split('\n')
+    output = []
+    fence = None
+    fence_close = ''
+    in_comment = False
+    in_quote = False
+    in_table = False
+    # Indentation and Jira marker of each open list level
+    list_levels = []
+
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+
+        if fence is not None:
+            if line.strip().startswith(fence):
+                output.append(fence_close)
+                fence = None
+            else:
+                output.append(line)
+            continue
+
+        # HTML comments (such as issue template hints) aren't shown on GitHub either
+        if in_comment:
+            end = line.find('-->')
+            if end == -1:
+                continue
+            line = line[end + 3:]
+            in_comment = False
+            if line.strip() == '':
+                continue
+        start = line.find('<!--')
+        has_comment = start != -1
+        while start != -1:
+            end = line.find('-->', start + 4)
+            if end == -1:
+                line = line[:start]
+                in_comment = True
+                break
+            line = line[:start] + line[end + 3:]
+            start = line.find('<!--', start)
+        # Lines that only held a comment are dropped rather than left blank
+        if has_comment and line.strip() == '':
+            continue
+
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+
+        if in_quote and not stripped.startswith('>'):
+            output.append('{quote}')
+            in_quote = False
+        if in_table and not '|' in stripped:
+            in_table = False
+
+        if stripped.startswith(fence_markers):
+            fence = stripped[:3]
+            language = stripped[3:].strip().split(' ')[0]
+            if language:
+                output.append('{code:' + language + '}')
+                fence_close = '{code}'
+            else:
+                output.append('{noformat}')
+                fence_close = '{noformat}'
+            continue
+
+        if stripped == '':
+            list_levels = []
+            output.append('')
+            continue
+
+        if stripped.startswith('#'):
+            level = len(stripped) - len(stripped.lstrip('#'))
+            if level <= 6 and stripped[level:level + 1] in (' ', ''):
+                list_levels = []
+                heading = stripped[level:].strip().rstrip('#').strip()
+                # Headings without text are empty on GitHub, where Jira would show a bare h1.
+                output.append(f'h{level}. ' + convert_inline(heading) if heading else '')
+                continue
+
+        if indent < 4 and is_rule(stripped):
+            list_levels = []
+            output.append('----')
+            continue
+
+        if stripped.startswith('>'):
+            if not in_quote:
+                output.append('{quote}')
+                in_quote = True
+            output.append(convert_inline(stripped[1:].strip()))
+            continue
+
+        marker, item = list_item(stripped)
+        if marker is not None:
+            while len(list_levels) > 0 and list_levels[-1][0] > indent:
+                list_levels.pop()
+            if len(list_levels) > 0 and list_levels[-1][0] == indent:
+                list_levels[-1] = (indent, marker)
+            else:
+                list_levels.append((indent, marker))
+            icon = task_icons.get(item[:3])
+            if icon is not None and item[3:4] in (' ', ''):
+                item = icon + item[3:]
+            output.append(''.join(level_marker for _, level_marker in list_levels) +
+                          ' ' + convert_inline(item))
+            continue
+
+        # Lines indented under a list item continue it
+        if len(list_levels) > 0 and indent > 0:
+            output.append(convert_inline(stripped))
+            continue
+        list_levels = []
+
+        if not in_table and '|' in stripped and index < len(lines) and is_table_separator(lines[index]):
+            in_table = True
+            index += 1
+            output.append(table_row(split_cells(stripped), '||'))
+            continue
+        if in_table:
+            output.append(table_row(split_cells(stripped), '|'))
+            continue
+
+        output.append(convert_inline(line))
+
+    if fence is not None:
+        output.append(fence_close)
+    if in_quote:
+        output.append('{quote}')
+
+    return '\n'.join(output)
+
+
+memoized_convert = lru_cache(maxsize=memoized_bodies)(convert)
+
+
+def to_jira(markdown):
+    """Convert GitHub Markdown to Jira wiki markup, memoizing smaller bodies since they repeat a lot (such as bot comments)"""
+
+    if markdown and len(markdown) <= memoized_body_size:
+        return memoized_convert(markdown)
+
+    return convert(markdown)
@@ -0,0 +1,397 @@
+from array import array
+import json
+import re
+import sys
+import threading
+import time
+
+# Latency histogram buckets in seconds (for the Prometheus summary)
+latency_buckets = [0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# Stages of the migration, in the order they happen
+stages = ['fetch', 'map', 'create', 'comment',
+          'transition', 'write_back', 'finished']
+# Seconds in between progress lines (0 disables them)
+progress_interval = 10
+# Expected number of issues to apply, for the ETA (None if unknown)
+expected_issues = None
+# Name shown in progress lines (such as the repo when migrating several)
+progress_label = ''
+
+lock = threading.Lock()
+started = time.time()
+# Dict of (service, method, endpoint) to request stats
+endpoints = {}
+# Dict of stage to {'count', 'first', 'last'}
+stage_stats = {}
+
+progress_stop = threading.Event()
+progress_thread = None
+# Time and number of finished issues when progress reporting started
+progress_started = started
+progress_base = 0
+
+
+def endpoint_name(url, body=None):
+    """Return the endpoint of a URL with IDs and issue keys replaced by placeholders"""
+
+    path = re.sub(r'^[a-z]+://[^/]+', '', url.split('?')[0])
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', path)
+    path = re.sub(r'/[A-Z][A-Z0-9]+-\d+(?=/|$)', '/{key}', path)
+    # Uploaded files are named by UUID or file name
+    path = re.sub(r'/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=/|$)', '/{uuid}', path)
+    path = re.sub(r'/[^/]+\.\w+$', '/{file}', path)
+
+    # GraphQL requests all go to one URL, so name them after their operation name or top-level field
+    if isinstance(body, dict) and 'query' in body:
+        field = re.match(r'\s*(?:query|mutation)\s+(\w+)', body['query']) or \
+            re.search(r'\{\s*(?:\w+\s*:\s*)?(\w+)', body['query'])
+        if field:
+            path = f'{path} {field.group(1)}'
+
+    return path
+
+
+def endpoint_stats(service, method, endpoint):
+    """Return the stats of an endpoint, adding them if not seen before (called with the lock held)"""
+
+    key = (service, method, endpoint)
+    if not key in endpoints:
+        endpoints[key] = {
+            'count': 0,
+            'statuses': {},
+            'retries': 0,
+            'errors': 0,
+            'request_bytes': 0,
+            'response_bytes': 0,
+            'latencies': array('d')
+        }
+
+    return endpoints[key]
+
+
+def record_request(service, method, url, json_body, response, seconds, streamed=False):
+    """Record a request and its response (None if it raised) to an endpoint"""
+
+    endpoint = endpoint_name(url, json_body)
+    request_bytes = 0
+    response_bytes = 0
+    if response is not None:
+        if response.request is not None and response.request.body:
+            request_bytes = len(response.request.body)
+        if streamed:
+            # Reading the content would load a streamed response into memory
+            response_bytes = int(response.headers.get('Content-Length') or 0)
+        else:
+            response_bytes = len(response.content or b'')
+
+    with lock:
+        stats = endpoint_stats(service, method, endpoint)
+        stats['count'] += 1
+        if response is None:
+            stats['errors'] += 1
+        else:
+            status = str(response.status_code)
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+        stats['request_bytes'] += request_bytes
+        stats['response_bytes'] += response_bytes
+        stats['latencies'].append(seconds)
+
+
+def record_retry(service, method, url, json_body=None):
+    """Record that a request to an endpoint is being retried"""
+
+    endpoint = endpoint_name(url, json_body)
+    with lock:
+        endpoint_stats(service, method, endpoint)['retries'] += 1
+
+
+def stage(name, count=1):
+    """Record items that completed a stage of the migration"""
+    assert name in stages  # stage needs to be known
+
+    now = time.time()
+    with lock:
+        stats = stage_stats.setdefault(
+            name, {'count': 0, 'first': now, 'last': now})
+        stats['count'] += count
+        stats['last'] = now
+
+
+def counted(iterable, name, size=None):
+    """Yield items from an iterable, recording each (or size(item) for batches) as completing a stage"""
+
+    for item in iterable:
+        stage(name, 1 if size is None else size(item))
+        yield item
+
+
+def reset():
+    """Discard the metrics recorded so far"""
+
+    global started, expected_issues
+    with lock:
+        started = time.time()
+        expected_issues = None
+        endpoints.clear()
+        stage_stats.clear()
+
+
+def snapshot():
+    """Return a copy of the raw metrics recorded so far, to be merged into another process's metrics"""
+
+    with lock:
+        return {
+            'started': started,
+            'endpoints': {key: dict(stats, statuses=dict(stats['statuses']), latencies=stats['latencies'].tolist())
+                          for key, stats in endpoints.items()},
+            'stages': {name: dict(stats) for name, stats in stage_stats.items()}
+        }
+
+
+def merge(metrics):
+    """Add the raw metrics of another process (from snapshot) to the metrics recorded here"""
+
+    global started
+    with lock:
+        started = min(started, metrics['started'])
+        for (service, method, endpoint), other in metrics['endpoints'].items():
+            stats = endpoint_stats(service, method, endpoint)
+            for key in ['count', 'retries', 'errors', 'request_bytes', 'response_bytes']:
+                stats[key] += other[key]
+            for status, count in other['statuses'].items():
+                stats['statuses'][status] = stats['statuses'].get(status, 0) + count
+            stats['latencies'].extend(other['latencies'])
+        for name, other in metrics['stages'].items():
+            if not name in stage_stats:
+                stage_stats[name] = dict(other)
+                continue
+            stats = stage_stats[name]
+            stats['count'] += other['count']
+            stats['first'] = min(stats['first'], other['first'])
+            stats['last'] = max(stats['last'], other['last'])
+
+
+def percentile(sorted_values, fraction):
+    """Return a percentile of sorted values (nearest rank)"""
+
+    if len(sorted_values) == 0:
+        return None
+
+    index = min(len(sorted_values) - 1,
+                max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+
+    return sorted_values[index]
+
+
+def stage_count(name):
+    """Return the number of items that completed a stage"""
+
+    with lock:
+        return stage_stats.get(name, {}).get('count', 0)
+
+
+def summary():
+    """Return a JSON-serializable summary of the requests and stages so far"""
+
+    now = time.time()
+    with lock:
+        endpoint_items = [(key, dict(stats, latencies=sorted(stats['latencies'])))
+                          for key, stats in endpoints.items()]
+        stage_items = [(name, dict(stage_stats[name]))
+                       for name in stages if name in stage_stats]
+
+    endpoint_summaries = []
+    for (service, method, endpoint), stats in endpoint_items:
+        latencies = stats['latencies']
+        endpoint_summaries.append({
+            'service': service,
+            'method': method,
+            'endpoint': endpoint,
+            'count': stats['count'],
+            'statuses': stats['statuses'],
+            'retries': stats['retries'],
+            'errors': stats['errors'],
+            'request_bytes': stats['request_bytes'],
+            'response_bytes': stats['response_bytes'],
+            'seconds': sum(latencies),
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else None,
+            'buckets': [sum(1 for latency in latencies if latency <= bucket) for bucket in latency_buckets]
+        })
+    # Endpoints that took the most time in total first, since they're the likely bottlenecks
+    endpoint_summaries.sort(key=lambda stats: stats['seconds'], reverse=True)
+
+    stage_summaries = {}
+    for name, stats in stage_items:
+        active = max(stats['last'] - stats['first'], 0.001)
+        stage_summaries[name] = {
+            'count': stats['count'],
+            'seconds': stats['last'] - stats['first'],
+            'per_second': stats['count'] / active if stats['count'] > 1 else None
+        }
+
+    return {
+        'started': started,
+        'seconds': now - started,
+        'endpoints': endpoint_summaries,
+        'stages': stage_summaries
+    }
+
+
+def prometheus_label(value):
+    """Escape a Prometheus label value"""
+
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus(metrics):
+    """Return a summary in the Prometheus text exposition format"""
+
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for suffix, labels, value in samples:
+            label_text = ','.join(
+                f'{label}="{prometheus_label(label_value)}"' for label, label_value in labels.items())
+            lines.append(f'{name}{suffix}{{{label_text}}} {value}')
+
+    def labels(stats, **extra):
+        return dict({
+            'service': stats['service'],
+            'method': stats['method'],
+            'endpoint': stats['endpoint']
+        }, **extra)
+
+    endpoint_summaries = metrics['endpoints']
+    metric('migration_http_requests_total', 'counter', 'HTTP requests sent, by response status.', [
+        ('', labels(stats, status=status), count)
+        for stats in endpoint_summaries for status, count in stats['statuses'].items()])
+    for name, key, help_text in [
+            ('migration_http_request_errors_total', 'errors', 'HTTP requests that failed without a response.'),
+            ('migration_http_retries_total', 'retries', 'HTTP requests retried after being rate limited.'),
+            ('migration_http_request_bytes_total', 'request_bytes', 'Bytes sent in HTTP request bodies.'),
+            ('migration_http_response_bytes_total', 'response_bytes', 'Bytes received in HTTP response bodies.')]:
+        metric(name, 'counter', help_text, [
+            ('', labels(stats), stats[key]) for stats in endpoint_summaries])
+
+    samples = []
+    for stats in endpoint_summaries:
+        for bucket, count in zip(latency_buckets, stats['buckets']):
+            samples.append(('_bucket', labels(stats, le=bucket), count))
+        samples.append(('_bucket', labels(stats, le='+Inf'), stats['count']))
+        samples.append(('_sum', labels(stats), stats['seconds']))
+        samples.append(('_count', labels(stats), stats['count']))
+    metric('migration_http_request_duration_seconds', 'histogram',
+           'HTTP request latency in seconds.', samples)
+
+    metric('migration_stage_items_total', 'counter', 'Items that completed each migration stage.', [
+        ('', {'stage': name}, stats['count']) for name, stats in metrics['stages'].items()])
+    metric('migration_stage_items_per_second', 'gauge', 'Throughput of each migration stage while it was active.', [
+        ('', {'stage': name}, stats['per_second']) for name, stats in metrics['stages'].items()
+        if stats['per_second'] is not None])
+    metric('migration_duration_seconds', 'gauge', 'Duration of the migration run.', [
+        ('', {}, metrics['seconds'])])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_summary(path):
+    """Write the summary as JSON to a path and in the Prometheus text format next to it (with .prom)"""
+
+    metrics = summary()
+
+    metrics_file = open(path, 'w')
+    json.dump(metrics, metrics_file, indent=2)
+    metrics_file.close()
+
+    prometheus_path = re.sub(r'(\.json)?$', '.prom', path, count=1)
+    prometheus_file = open(prometheus_path, 'w')
+    prometheus_file.write(prometheus(metrics))
+    prometheus_file.close()
+
+    return metrics
+
+
+def print_summary(limit=10):
+    """Print the endpoints that took the most time and the throughput of each stage"""
+
+    metrics = summary()
+
+    print(f'* Requests by total time ({metrics["seconds"]:.1f}s run):')
+    for stats in metrics['endpoints'][:limit]:
+        statuses = ', '.join(
+            f'{status}: {count}' for status, count in sorted(stats['statuses'].items()))
+        print(f'  {stats["service"]} {stats["method"]} {stats["endpoint"]}: {stats["count"]} requests, '
+              f'{stats["seconds"]:.1f}s total, p50 {stats["p50"] * 1000:.0f}ms, p95 {stats["p95"] * 1000:.0f}ms, '
+              f'p99 {stats["p99"] * 1000:.0f}ms, {stats["retries"]} retries ({statuses})')
+
+    print('* Stage throughput:')
+    for name, stats in metrics['stages'].items():
+        per_second = 'n/a' if stats['per_second'] is None else f'{stats["per_second"]:.1f}/s'
+        print(f'  {name}: {stats["count"]} ({per_second})')
+
+
+def format_duration(seconds):
+    """Format seconds as hours, minutes, and seconds"""
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours}h{minutes:02d}m{seconds:02d}s'
+
+    return f'{minutes}m{seconds:02d}s'
+
+
+def progress_line():
+    """Return a line with the number of issues finished, the rate, and the ETA"""
+
+    elapsed = time.time() - progress_started
+    finished = stage_count('finished') - progress_base
+    rate = finished / elapsed if elapsed > 0 else 0
+
+    line = '* Progress'
+    if progress_label:
+        line += f' ({progress_label})'
+    line += f': {finished}'
+    if expected_issues:
+        line += f'/{expected_issues} issues finished ({min(finished / expected_issues, 1):.0%})'
+    else:
+        line += ' issues finished'
+    line += f', {rate:.1f} issues/sec, {stage_count("fetch")} fetched, {stage_count("map")} mapped'
+    if expected_issues and rate > 0:
+        line += f', ETA {format_duration(max(expected_issues - finished, 0) / rate)}'
+
+    return line
+
+
+def start_progress():
+    """Print a progress line to stderr every progress_interval seconds until stop_progress is called"""
+
+    global progress_thread, progress_started, progress_base
+
+    if progress_interval <= 0:
+        return
+
+    progress_started = time.time()
+    progress_base = stage_count('finished')
+
+    def report():
+        while not progress_stop.wait(progress_interval):
+            print(progress_line(), file=sys.stderr, flush=True)
+
+    progress_stop.clear()
+    progress_thread = threading.Thread(target=report, daemon=True)
+    progress_thread.start()
+
+
+def stop_progress():
+    """Stop printing progress lines"""
+
+    progress_stop.set()
+    if progress_thread is not None:
+        progress_thread.join()
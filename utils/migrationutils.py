@@ -1,9 +1,66 @@
 import utils.ghutils as ghutils
 import utils.jirautils as jirautils
+import utils.markuputils as markuputils
 import utils.zenhubutils as zenhubutils
+from concurrent.futures import Future
+import threading
 
 jira_product_versions = {}
-gh_repo_id = ""
+jira_product_versions_lock = threading.Lock()
+# Dict of GitHub org/repo to repo ID
+gh_repo_ids = {}
+gh_repo_id_lock = threading.Lock()
+
+# Cache of resolved Jira users (a utils.cacheutils.Cache set up by the caller)
+user_cache = None
+user_cache_negative_ttl = 60 * 60
+user_requests = {}
+user_requests_lock = threading.Lock()
+
+# Whether GitHub Markdown in issue and comment bodies is converted to Jira wiki markup
+convert_markdown = True
+
+
+def get_jira_user(user_query):
+    """Return the Jira user name for a query (username, name, or e-mail), using the user cache"""
+
+    with user_requests_lock:
+        request = user_requests.get(user_query)
+        is_owner = request is None
+        if is_owner:
+            if user_cache:
+                cached_user = user_cache.get(user_query)
+                if cached_user is not None:
+                    return cached_user.get('name')
+            # Register the lookup so concurrent callers wait on it rather than repeating it
+            request = Future()
+            user_requests[user_query] = request
+
+    if not is_owner:
+        return request.result()
+
+    try:
+        user_name = None
+        user_query_response = jirautils.get_user(user_query)
+        if user_query_response and len(user_query_response) > 0:
+            user_name = user_query_response[0]['name']
+
+        if user_cache:
+            if user_name:
+                user_cache.set(user_query, {'name': user_name})
+            else:
+                # Negative entries expire sooner in case the user is added later
+                user_cache.set(user_query, {}, ttl=user_cache_negative_ttl)
+
+        request.set_result(user_name)
+    except BaseException as e:
+        request.set_exception(e)
+        raise
+    finally:
+        with user_requests_lock:
+            del user_requests[user_query]
+
+    return user_name
 
 
 def user_map(gh_username, user_mapping, default_user=''):
@@ -17,98 +74,39 @@ def user_map(gh_username, user_mapping, default_user=''):
         user_email = user_mapping[gh_username]
 
     if user_email != '':
-        user_query = jirautils.get_user(user_email)
-        if user_query and len(user_query) > 0:
-            user = {'name': user_query[0]['name']}
+        user_name = get_jira_user(user_email)
+        if user_name:
+            user = {'name': user_name}
 
     return user
 
 
-def component_map(gh_labels, component_map):
-    """Return the Jira components from a given GitHub label"""
-
-    components = []
-    component_count = 0
-    is_ui = False
-    for label in gh_labels:
-        label_name = str(label['name'])
-        if label_name.startswith('squad:'):
-            component_count += 1
-            if label_name in component_map:
-                components.append({'name': component_map[label_name]})
-                if label_name.endswith("-ui"):
-                    is_ui = True
-        elif label_name in component_map:
-            component_count += 1
-            components.append({'name': component_map[label_name]})
-
-    return components, component_count, is_ui
-
-
-def type_map(gh_labels):
-    """Return the Jira issue type from a given GitHub label"""
-
-    type_map = {
-        'task': 'Task',
-        'bug': 'Bug',
-        'user_story': 'Story',
-        'Epic': 'Epic'
-    }
-
-    for label in gh_labels:
-        label_name = str(label['name'])
-        if label_name in type_map:
-            return type_map[label_name]
-
-    return 'Task'
-
-
-def priority_map(gh_labels):
-    """Return the Jira priority from a given GitHub label"""
-
-    priority_map = {
-        'blocker (P0)': 'Blocker',
-        'Priority/P1': 'Critical',
-        'Priority/P2': 'Normal',
-        'Priority/P3': 'Minor',
-    }
-
-    priority = {
-        'name': 'Undefined'
-    }
-
-    for label in gh_labels:
-        label_name = str(label['name'])
-        if label_name in priority_map:
-            if priority_map[label_name] != '':
-                priority['name'] = priority_map[label_name]
-                break
-
-    return priority
+def get_repo_id():
+    """Return the ID of the current GitHub repo, fetching it once if not already populated"""
 
+    with gh_repo_id_lock:
+        if not ghutils.org_repo in gh_repo_ids:
+            if ghutils.repo_database_id:
+                gh_repo_ids[ghutils.org_repo] = str(ghutils.repo_database_id)
+            else:
+                gh_repo_ids[ghutils.org_repo] = str(ghutils.get_repo()['id'])
 
-def severity_map(gh_labels):
-    """Return the Jira severity from a given GitHub label"""
+        return gh_repo_ids[ghutils.org_repo]
 
-    severity_map = {
-        'Severity 1 - Urgent': 'Critical',
-        'Severity 2 - Major': 'Moderate',
-        'Severity 3 - Minor': 'Low',
-    }
 
-    severity = {}
+def get_product_versions(issue_type):
+    """Return the Jira product version names for an issue type, fetching them once"""
 
-    for label in gh_labels:
-        label_name = str(label['name'])
-        if label_name in severity_map:
-            if severity_map[label_name] != '':
-                severity['value'] = severity_map[label_name]
-                break
-
-    if 'value' in severity:
-        return severity
+    with jira_product_versions_lock:
+        if not issue_type in jira_product_versions:
+            version_response = []
+            issue_meta = jirautils.get_issue_meta(issue_type)
+            if issue_meta and 'fixVersions' in issue_meta['fields']:
+                version_response = issue_meta['fields']['fixVersions']['allowedValues']
+            jira_product_versions[issue_type] = list(
+                map(lambda version: version['name'], version_response))
 
-    return None
+    return jira_product_versions[issue_type]
 
 
 def status_map(pipeline, issue_type):
@@ -147,28 +145,20 @@ def status_map(pipeline, issue_type):
     return None
 
 
-def should_close(gh_issue):
-    """Return the whether an issue has a label signaling it should not be closed"""
-
-    no_close_labels = 'bugzilla,canary-failure'
-
-    return ghutils.has_label(gh_issue, no_close_labels)
-
-
-def issue_map(gh_issue, component_mapping, user_mapping, default_user):
+def issue_map(gh_issue, label_rules, user_mapping, default_user):
     """Return a dict for Jira to process from a given GitHub issue"""
     assert user_mapping != None  # user_mapping cannot be None
 
-    gh_labels = gh_issue['labels']
+    # Map the type, priority, severity, and components from the labels in one pass
+    label_result = label_rules.evaluate(gh_issue['labels'])
+    components = label_result['components']
 
     # Flag for whether the GitHub issue can be closed after migration
     # Don't close the issue if:
     # - It's connected to Bugzilla
     # - It's a multi-squad issue
     can_close = True
-    components, component_count, is_ui = component_map(
-        gh_labels, component_mapping)
-    if component_count > 1 or should_close(gh_issue):
+    if label_result['component_count'] > 1 or label_result['no_close']:
         can_close = False
 
     assignee = None
@@ -184,31 +174,18 @@ def issue_map(gh_issue, component_mapping, user_mapping, default_user):
     # Make sure a string is returned for the issue body
     issue_body = ''
     if gh_issue['body']:
-        issue_body = gh_issue['body']
+        issue_body = body_map(gh_issue['body'])
 
     issue_title = gh_issue['title']
-    issue_type = type_map(gh_labels)
+    issue_type = label_result['type']
 
-    # Fetch repo ID if not already populated
-    global gh_repo_id
-    if gh_repo_id == "":
-        gh_repo_id = str(ghutils.get_repo()['id'])
-    
     # Gather ZenHub issue data
     zenhub_data = zenhubutils.get_issue_data(
-        gh_repo_id, str(gh_issue['number']))
+        get_repo_id(), str(gh_issue['number']))
 
     releases = []
     for release in zenhub_data['releases']:
-        # Only fetch if not already populated
-        if not issue_type in jira_product_versions:
-            version_response = jirautils.get_issue_meta(
-                issue_type)['fields']['fixVersions']['allowedValues']
-            if len(version_response) > 0:
-                jira_product_versions[issue_type] = list(
-                    map(lambda version: version['name'], version_response))
-
-        for version in jira_product_versions[issue_type]:
+        for version in get_product_versions(issue_type):
             if version == release:
                 releases.append({
                     'name': release
@@ -217,7 +194,7 @@ def issue_map(gh_issue, component_mapping, user_mapping, default_user):
 
     # Handle labels
     labels = []
-    if is_ui:
+    if label_result['is_ui']:
         labels.append('ui')
 
     issue_mapping = {
@@ -231,7 +208,9 @@ def issue_map(gh_issue, component_mapping, user_mapping, default_user):
         'assignee': assignee,
         jirautils.contributors_field: contributors,
         'status': status_map(zenhub_data['pipeline'], issue_type),
-        'priority': priority_map(gh_labels),
+        'priority': {
+            'name': label_result['priority']
+        },
         'fixVersions': releases,
         'labels': labels,
         jirautils.story_points_field: zenhub_data['estimate'],
@@ -244,16 +223,68 @@ def issue_map(gh_issue, component_mapping, user_mapping, default_user):
 
     if issue_type == 'Bug':
         # Custom "Severity" field
-        issue_mapping[jirautils.severity_field] = severity_map(gh_labels)
+        severity = None
+        if label_result['severity']:
+            severity = {
+                'value': label_result['severity']
+            }
+        issue_mapping[jirautils.severity_field] = severity
 
     return issue_mapping, can_close
 
 
+def body_map(gh_body):
+    """Return the Jira markup of a GitHub issue or comment body"""
+
+    if convert_markdown:
+        return markuputils.to_jira(gh_body)
+
+    return gh_body
+
+
 def comment_map(gh_comment):
     """Return a dict for Jira to process from a given GitHub comment"""
 
     gh_user = gh_comment['user']['login']
 
     return {
-        'body': f'{gh_comment["created_at"]} @{gh_user}\n{gh_comment["body"]}'
+        'body': f'{gh_comment["created_at"]} @{gh_user}\n{body_map(gh_comment["body"] or "")}'
     }
+
+
+def fold_comments(indexed_comments, fold_size):
+    """Return (index, mapped comment) pairs folded into as few comments of up to fold_size bytes as possible, with the indexes in each"""
+    assert 0 < fold_size <= jirautils.max_comment_length  # fold size needs to be set properly
+
+    separator = '\n----\n'
+    folded = []
+    indexes = []
+    bodies = []
+    size = 0
+    for index, comment in indexed_comments:
+        comment_size = len(comment['body'].encode('utf-8'))
+        # Comments are kept in order, and a comment larger than the fold size is left on its own
+        if len(bodies) > 0 and size + len(separator) + comment_size > fold_size:
+            folded.append((indexes, {'body': separator.join(bodies)}))
+            indexes = []
+            bodies = []
+            size = 0
+        if len(bodies) > 0:
+            size += len(separator)
+        indexes.append(index)
+        bodies.append(comment['body'])
+        size += comment_size
+    if len(bodies) > 0:
+        folded.append((indexes, {'body': separator.join(bodies)}))
+
+    return folded
+
+
+def comment_groups(comment_maps, indexes, fold_size=None):
+    """Return the mapped comments at the indexes grouped into the Jira comments to add, each with its indexes"""
+
+    indexed_comments = [(index, comment_maps[index]) for index in indexes]
+    if fold_size is None:
+        return [([index], comment_map) for index, comment_map in indexed_comments]
+
+    return fold_comments(indexed_comments, fold_size)
@@ -0,0 +1,59 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+
+# Number of items buffered between pipeline stages
+queue_size = 100
+
+end_of_stage = object()
+
+
+def prefetch(iterable, size=None):
+    """Yield items from an iterable that is consumed ahead on a background thread into a bounded queue"""
+
+    if size is None:
+        size = queue_size
+    assert size > 0  # queue size needs to be set properly
+
+    buffer = queue.Queue(maxsize=size)
+
+    def produce():
+        try:
+            for item in iterable:
+                buffer.put((item, None))
+        except BaseException as e:
+            # Hand errors (including exit() calls) to the consuming thread
+            buffer.put((end_of_stage, e))
+            return
+        buffer.put((end_of_stage, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    while True:
+        item, error = buffer.get()
+        if error is not None:
+            raise error
+        if item is end_of_stage:
+            return
+        yield item
+
+
+def ordered_map(function, iterable, workers=1, window=None):
+    """Yield (item, function(item)) in order, running up to workers calls ahead of the consumer"""
+    assert workers > 0  # workers needs to be set properly
+
+    if window is None:
+        window = workers * 2
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= window:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while len(pending) > 0:
+            item, future = pending.popleft()
+            yield item, future.result()
@@ -0,0 +1,123 @@
+from email.utils import parsedate_to_datetime
+import threading
+import time
+
+# Seconds to wait on a rate-limited response that doesn't say how long to wait
+default_retry_after = 60
+# Fraction of the remaining rate limit budget to keep in reserve when pacing requests
+reserve = 0.05
+
+
+class TokenBucket:
+    """Token bucket that paces requests to a service, adjusted from the rate limit headers it returns"""
+
+    def __init__(self, rate, burst=None):
+        assert rate > 0  # rate needs to be set properly
+
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.waiting_writes = 0
+        self.condition = threading.Condition()
+
+    def refill(self, now):
+        """Add the tokens accumulated since the last refill"""
+
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, is_write=False):
+        """Wait until a request may be sent, letting waiting writes go ahead of reads"""
+
+        with self.condition:
+            if is_write:
+                self.waiting_writes += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    if now < self.paused_until:
+                        self.condition.wait(self.paused_until - now)
+                    elif not is_write and self.waiting_writes > 0:
+                        # Reads are speculative, so they wait for pending writes to get a token first
+                        self.condition.wait(1 / self.rate)
+                    elif self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    else:
+                        self.condition.wait((1 - self.tokens) / self.rate)
+            finally:
+                if is_write:
+                    self.waiting_writes -= 1
+                    self.condition.notify_all()
+
+    def pause(self, seconds):
+        """Hold all requests for a number of seconds"""
+
+        with self.condition:
+            self.paused_until = max(
+                self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def observe(self, response):
+        """Adjust the pace from a response's rate limit headers, returning whether it was rate limited"""
+
+        remaining = remaining_requests(response.headers.get('X-RateLimit-Remaining'))
+        reset_seconds = reset_delay(response.headers.get('X-RateLimit-Reset'))
+        retry_after = retry_delay(response.headers.get('Retry-After'))
+
+        if remaining is not None and reset_seconds is not None:
+            with self.condition:
+                # Spread what's left of the budget over the time until it resets
+                budget = remaining * (1 - reserve)
+                self.rate = max(
+                    min(self.max_rate, budget / max(reset_seconds, 1)), 0.01)
+            if remaining == 0:
+                self.pause(reset_seconds + 1)
+
+        rate_limited = response.status_code == 429 or (
+            response.status_code == 403 and (retry_after is not None or remaining == 0))
+        if rate_limited:
+            if retry_after is None:
+                retry_after = reset_seconds if reset_seconds is not None else default_retry_after
+            print(
+                f'* Rate limited by {response.url}, waiting {int(retry_after)} seconds')
+            self.pause(retry_after)
+
+        return rate_limited
+
+
+def remaining_requests(remaining_header):
+    """Return the requests left from an X-RateLimit-Remaining header (None if missing or malformed)"""
+
+    if remaining_header is None or not remaining_header.isdigit():
+        return None
+
+    return int(remaining_header)
+
+
+def reset_delay(reset_header):
+    """Return the seconds until a rate limit resets from an epoch seconds X-RateLimit-Reset header"""
+
+    if reset_header is None or not reset_header.isdigit():
+        return None
+
+    return max(0, int(reset_header) - time.time())
+
+
+def retry_delay(retry_after_header):
+    """Return the seconds to wait from a Retry-After header in seconds or HTTP date form"""
+
+    if retry_after_header is None:
+        return None
+    if retry_after_header.isdigit():
+        return int(retry_after_header)
+
+    try:
+        return max(0, parsedate_to_datetime(retry_after_header).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,186 @@
+from datetime import datetime, timezone
+import hashlib
+import json
+from pprint import pprint
+import utils.jirautils as jirautils
+import utils.metricsutils as metricsutils
+import utils.migrationutils as migrationutils
+
+# Settings for syncing issues (populated from config.json and CLI arguments)
+dry_run = False
+verbose = False
+# Bytes of GitHub comments to fold into each Jira comment (None adds each GitHub comment as its own Jira comment)
+fold_size = None
+# Caches (utils.cacheutils.Cache) of the synced state of each GitHub issue and the last sync of each repo
+issue_state = None
+watermarks = None
+# Jira fields that aren't updated by a sync (they can't change or are set when the issue is created)
+fixed_fields = ['project', 'security', 'issuetype',
+                'reporter', jirautils.gh_issue_field]
+# Seconds subtracted from the watermark to allow for clock skew between here and GitHub
+watermark_skew = 5 * 60
+
+
+def content_hash(value):
+    """Return a hash of a JSON-serializable value"""
+
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def field_hashes(props):
+    """Return the hash of each syncable Jira field (and the status) of mapped props"""
+
+    fields = jirautils.issue_fields(props)
+    hashes = {field: content_hash(value) for field, value in fields.items()
+              if not field in fixed_fields}
+    hashes['status'] = content_hash(props['status'])
+
+    return hashes
+
+
+def seed(gh_issue_url, jira_key, props, comment_ids, is_transitioned=True):
+    """Record the state of a migrated GitHub issue as the baseline for syncing it (comment_ids may be None if unknown)"""
+
+    if issue_state is None:
+        return
+
+    hashes = field_hashes(props)
+    # A status that wasn't reached is left out so the next sync transitions the issue again
+    if not is_transitioned:
+        del hashes['status']
+
+    issue_state.set(gh_issue_url, {
+        'key': jira_key,
+        'fields': hashes,
+        'comment_ids': comment_ids
+    })
+
+
+def get_state(gh_issue_url):
+    """Return the synced state of a GitHub issue (None if it hasn't been migrated or synced)"""
+
+    return issue_state.get(gh_issue_url)
+
+
+def changes(state, props, comment_ids):
+    """Return the Jira fields and the indexes of the mapped comments that changed since the synced state"""
+
+    hashes = field_hashes(props)
+    changed_fields = [field for field in hashes
+                      if hashes[field] != state['fields'].get(field)]
+
+    # Comments from before the sync state recorded comment IDs are treated as already migrated
+    if state['comment_ids'] is None:
+        new_comments = []
+    else:
+        seen_ids = set(state['comment_ids'])
+        new_comments = [index for index, comment_id in enumerate(comment_ids)
+                        if not comment_id in seen_ids]
+
+    return changed_fields, new_comments
+
+
+def sync_issue(jira_key, mapping_obj, state):
+    """Send the fields and comments of a mapping that changed since the synced state to its Jira issue and return the counts"""
+
+    gh_url = mapping_obj['issue'][jirautils.gh_issue_field]
+    props = mapping_obj['issue']
+    comment_ids = mapping_obj['comment_ids']
+    changed_fields, new_comments = changes(state, props, comment_ids)
+    result = {'fields': 0, 'comments': 0, 'failed': False}
+
+    if len(changed_fields) == 0 and len(new_comments) == 0:
+        print(f'* No changes to sync to {jira_key} ({gh_url})')
+        # Comments from before comment IDs were recorded become the baseline for the next sync
+        if state['comment_ids'] is None and not dry_run:
+            issue_state.set(gh_url, dict(state, comment_ids=comment_ids))
+        return result
+
+    print(f'* Syncing {len(changed_fields)} fields ({", ".join(changed_fields) or "none"}) and '
+          f'{len(new_comments)} comments to {jira_key} ({gh_url})')
+    if dry_run:
+        return result
+
+    # Record what was sent as it goes, so a partly failed sync only retries what's left
+    hashes = field_hashes(props)
+    synced_hashes = dict(state['fields'])
+    synced_comment_ids = list(comment_ids if state['comment_ids'] is None
+                              else state['comment_ids'])
+
+    fields = jirautils.issue_fields(props)
+    update_data = {field: fields[field]
+                   for field in changed_fields if field != 'status'}
+    if len(update_data) > 0:
+        update_response = jirautils.update_issue(jira_key, update_data)
+        if verbose:
+            pprint(update_response)
+        if update_response.ok:
+            for field in update_data:
+                synced_hashes[field] = hashes[field]
+            result['fields'] += len(update_data)
+        else:
+            print(
+                f'* Error: Failed to update {jira_key} ({gh_url}): {update_response} {update_response.text}')
+            result['failed'] = True
+
+    if 'status' in changed_fields:
+        is_transitioned = True
+        if props['status']:
+            # Synced issues aren't in the initial status of the workflow, so start from their current status
+            is_transitioned, transition_response = jirautils.do_transition(
+                jira_key, props['status'], props['issuetype']['name'],
+                jirautils.get_issue_status(jira_key))
+            if verbose:
+                pprint(transition_response)
+        if is_transitioned:
+            synced_hashes['status'] = hashes['status']
+            result['fields'] += 1
+        else:
+            print(
+                f'* Error: Failed to transition {jira_key} to {props["status"]} ({gh_url})')
+            result['failed'] = True
+
+    for indexes, comment_map in migrationutils.comment_groups(mapping_obj['comments'], new_comments, fold_size):
+        comment_response = jirautils.add_comment(jira_key, comment_map)
+        if verbose:
+            pprint(comment_response)
+        if 'id' in comment_response:
+            synced_comment_ids.extend(comment_ids[index] for index in indexes)
+            result['comments'] += len(indexes)
+            metricsutils.stage('comment')
+        else:
+            print(
+                f'* Error: Failed to add a comment to {jira_key} ({gh_url}): {comment_response}')
+            result['failed'] = True
+
+    issue_state.set(gh_url, {
+        'key': jira_key,
+        'fields': synced_hashes,
+        'comment_ids': synced_comment_ids
+    })
+
+    return result
+
+
+def get_watermark(repo):
+    """Return the time (ISO 8601) of the last sync or migration of a repo, or None"""
+
+    if watermarks is None:
+        return None
+
+    return watermarks.get(repo)
+
+
+def new_watermark():
+    """Return the watermark for a run starting now, allowing for clock skew"""
+
+    now = datetime.now(timezone.utc).timestamp() - watermark_skew
+
+    return datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def set_watermark(repo, watermark):
+    """Record the start time of a completed sync or migration of a repo"""
+
+    if watermarks is not None:
+        watermarks.set(repo, watermark)
@@ -1,5 +1,5 @@
 import migrationauth
-import requests
+import utils.httputils as httputils
 
 base_url = 'https://api.zenhub.com/public/graphql'
 headers = {
@@ -8,21 +8,20 @@ headers = {
 }
 workspace_id = '604fab62d4b98d00150a2854'
 
+# Dict of "<repo ID>/<issue number>" to issue data for every issue in the
+# workspace's pipelines (populated by load_snapshot)
+snapshot = None
 
-def get_issue_data(gh_repo_id, gh_issue_number):
-    """Get ZenHub Pipeline and Releases for a GitHub issue"""
+httputils.register_session('zenhub', headers=headers)
 
-    query = """query {
-  issueByInfo(
-    repositoryGhId: """+gh_repo_id+""", 
-    issueNumber: """+gh_issue_number+"""
-  ) {
+issue_query = """query ($repositoryGhId: Int!, $issueNumber: Int!, $workspaceId: ID!) {
+  issueByInfo(repositoryGhId: $repositoryGhId, issueNumber: $issueNumber) {
     releases {
       nodes {
         title
       }
     }
-    pipelineIssue(workspaceId: \""""+workspace_id+"""\") {
+    pipelineIssue(workspaceId: $workspaceId) {
       pipeline {
         name
       }
@@ -33,10 +32,47 @@ def get_issue_data(gh_repo_id, gh_issue_number):
   }
 }"""
 
-    response = requests.post(
-        base_url,
-        headers=headers,
-        json={'query': query}
+pipelines_query = """query ($workspaceId: ID!) {
+  workspace(id: $workspaceId) {
+    pipelinesConnection(first: 100) {
+      nodes {
+        id
+        name
+      }
+    }
+  }
+}"""
+
+pipeline_issues_query = """query ($pipelineId: ID!, $after: String) {
+  searchIssuesByPipeline(pipelineId: $pipelineId, filters: {}, first: 100, after: $after) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    nodes {
+      number
+      repository {
+        ghId
+      }
+      estimate {
+        value
+      }
+      releases {
+        nodes {
+          title
+        }
+      }
+    }
+  }
+}"""
+
+
+def graphql(query, variables):
+    """Run a GraphQL query with variables and return its data"""
+
+    response = httputils.request(
+        'zenhub', 'POST', base_url, is_write=False,
+        json={'query': query, 'variables': variables}
     )
 
     if not response.ok:
@@ -45,15 +81,21 @@ def get_issue_data(gh_repo_id, gh_issue_number):
         exit(1)
 
     response_json = response.json()
+    if response_json.get('errors'):
+        print(
+            f'* An unexpected response was returned from ZenHub: {response_json["errors"]}')
+        exit(1)
 
-    issue_info = response_json['data']['issueByInfo']
+    return response_json['data']
+
+
+def issue_data(issue_info, pipeline):
+    """Return the estimate, pipeline, and releases from ZenHub issue info"""
 
     estimate = None
     if issue_info['estimate']:
         estimate = issue_info['estimate']['value']
 
-    pipeline = issue_info['pipelineIssue']['pipeline']['name']
-
     releases = []
     for release in issue_info['releases']['nodes']:
         releases.append(release['title'])
@@ -63,3 +105,53 @@ def get_issue_data(gh_repo_id, gh_issue_number):
         'pipeline': pipeline,
         'releases': releases
     }
+
+
+def load_snapshot():
+    """Index the pipeline, estimate, and releases of every issue in the workspace's pipelines"""
+
+    global snapshot
+
+    index = {}
+    workspace = graphql(pipelines_query, {'workspaceId': workspace_id})[
+        'workspace']
+    for pipeline in workspace['pipelinesConnection']['nodes']:
+        variables = {
+            'pipelineId': pipeline['id'],
+            'after': None
+        }
+        while True:
+            issues = graphql(pipeline_issues_query, variables)[
+                'searchIssuesByPipeline']
+            for issue_info in issues['nodes']:
+                issue_key = f'{issue_info["repository"]["ghId"]}/{issue_info["number"]}'
+                index[issue_key] = issue_data(issue_info, pipeline['name'])
+
+            if not issues['pageInfo']['hasNextPage']:
+                break
+            variables['after'] = issues['pageInfo']['endCursor']
+
+    snapshot = index
+
+    return snapshot
+
+
+def get_issue_data(gh_repo_id, gh_issue_number):
+    """Get ZenHub Pipeline and Releases for a GitHub issue"""
+
+    # Use the workspace snapshot if loaded, falling back to a query for issues not in a pipeline
+    if snapshot is not None:
+        issue_key = f'{gh_repo_id}/{gh_issue_number}'
+        if issue_key in snapshot:
+            return snapshot[issue_key]
+
+    variables = {
+        'repositoryGhId': int(gh_repo_id),
+        'issueNumber': int(gh_issue_number),
+        'workspaceId': workspace_id
+    }
+    issue_info = graphql(issue_query, variables)['issueByInfo']
+
+    pipeline = issue_info['pipelineIssue']['pipeline']['name']
+
+    return issue_data(issue_info, pipeline)